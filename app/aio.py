@@ -0,0 +1,185 @@
+"""Асинхронный режим работы бота.
+
+Обработчики NoteBot остаются синхронными по форме, но выполняются как greenlet
+поверх asyncio (тот же механизм, на котором построен sqlalchemy.ext.asyncio):
+каждый запрос к БД идет через асинхронный драйвер (asyncpg, aiosqlite),
+а каждый вызов Bot API — через httpx.AsyncClient. Пока один обработчик ждет
+сеть, цикл событий обслуживает остальные, и пул потоков не нужен.
+"""
+import asyncio
+import logging
+import signal
+from collections import namedtuple
+
+import httpx
+import urllib3
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.util import await_only, greenlet_spawn
+from telegram.error import TelegramError
+from telegram.utils.request import Request
+
+from engine import make_async_engine
+from metrics import TimedRequestMixin
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+_Response = namedtuple("_Response", "status data")
+
+
+def async_database_url(database_url):
+    """Подставляет в DATABASE_URL асинхронный драйвер той же СУБД."""
+    url = make_url(database_url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+def async_session_factory(database_url, **engine_kwargs):
+    """Фабрика обычных Session поверх асинхронного движка; пользоваться ей можно только в greenlet_spawn."""
+    engine = make_async_engine(async_database_url(database_url), **engine_kwargs)
+    return sessionmaker(bind=engine.sync_engine)
+
+
+class _AsyncConnectionPool:
+    """Замена urllib3-пула внутри Request: запрос уходит через httpx.AsyncClient,
+    а ожидание ответа отдается циклу событий через await_only.
+
+    Ошибки httpx переводятся в исключения urllib3, чтобы Request разобрал их как обычно.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def request(self, method, url, body=None, fields=None, headers=None, timeout=None):
+        kwargs = {}
+        if fields is not None:
+            data = {key: value for key, value in fields.items() if not isinstance(value, tuple)}
+            files = {key: value for key, value in fields.items() if isinstance(value, tuple)}
+            kwargs.update(data=data, files=files)
+        elif body is not None:
+            kwargs["content"] = body
+        if timeout is not None:
+            kwargs["timeout"] = httpx.Timeout(timeout.read_timeout, connect=timeout.connect_timeout)
+
+        try:
+            response = await_only(self.client.request(method, url, headers=headers, **kwargs))
+        except httpx.TimeoutException as e:
+            raise urllib3.exceptions.TimeoutError(str(e)) from e
+        except httpx.HTTPError as e:
+            raise urllib3.exceptions.HTTPError(str(e)) from e
+        return _Response(response.status_code, response.content)
+
+    def clear(self):
+        pass
+
+
+class AsyncRequest(TimedRequestMixin, Request):
+    """Request для telegram.Bot, выполняющий HTTP без блокировки цикла событий."""
+
+    def __init__(self, con_pool_size=100, connect_timeout=5.0, read_timeout=5.0):
+        super().__init__(con_pool_size=con_pool_size, connect_timeout=connect_timeout, read_timeout=read_timeout)
+        self._con_pool = _AsyncConnectionPool(
+            httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=con_pool_size),
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            )
+        )
+
+
+class AsyncRunner:
+    """Long polling и обработка обновлений NoteBot в одном цикле событий.
+
+    Обновления одного чата обрабатываются строго по очереди, разных чатов —
+    конкурентно, не больше concurrency одновременно.
+    """
+
+    def __init__(self, note_bot, concurrency=1000, poll_timeout=30):
+        self.note_bot = note_bot
+        self.bot = note_bot.updater.bot
+        self.dispatcher = note_bot.dispatcher
+        self.poll_timeout = poll_timeout
+
+        self._slots = asyncio.Semaphore(concurrency)
+        # chat_id -> [Lock, число ожидающих обновлений]
+        self._chats = {}
+        self._tasks = set()
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self, stop=None):
+        """Работает до установки события stop (по умолчанию — до SIGINT/SIGTERM)."""
+        if stop is None:
+            stop = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, stop.set)
+
+        try:
+            self.note_bot.outbound.start()
+            await greenlet_spawn(self.bot.delete_webhook)
+            background = [asyncio.create_task(self._poll())]
+            background += [
+                asyncio.create_task(self._repeat(self.note_bot.metrics.timed_job(callback), interval))
+                for callback, interval in self.note_bot.periodic_jobs()
+            ]
+
+            await stop.wait()
+
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+            # Дорабатываем уже принятые обновления
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            await asyncio.to_thread(self.note_bot.outbound.stop)
+            await greenlet_spawn(self.note_bot.reminders.flush)
+        finally:
+            # Соединения асинхронных драйверов живут в своих потоках и не дают процессу завершиться
+            engine = self.note_bot.Session.kw.get("bind")
+            if engine is not None:
+                await greenlet_spawn(engine.dispose)
+
+    async def _poll(self):
+        offset = None
+        while True:
+            try:
+                updates = await greenlet_spawn(self.bot.get_updates, offset=offset, timeout=self.poll_timeout)
+            except TelegramError as e:
+                logger.warning("Ошибка получения обновлений: %s", e)
+                await asyncio.sleep(1)
+                continue
+
+            for update in updates:
+                offset = update.update_id + 1
+                await self._slots.acquire()
+                task = asyncio.create_task(self._handle(update))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _handle(self, update):
+        chat_id = update.effective_chat.id if update.effective_chat else None
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            entry = self._chats[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await greenlet_spawn(self.dispatcher.process_update, update)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[chat_id]
+            self._slots.release()
+
+    async def _repeat(self, callback, interval):
+        while True:
+            try:
+                await greenlet_spawn(callback, None)
+            except Exception:
+                logger.exception("Ошибка фоновой задачи %s", callback)
+            await asyncio.sleep(interval)
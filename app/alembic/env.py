@@ -1,21 +1,26 @@
 from logging.config import fileConfig
-from sqlalchemy import create_engine, pool
+from sqlalchemy import pool
 from alembic import context
 import sys
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+# .env загружает engine.py при импорте database
 from database import Base
+from engine import make_engine
 
 # Разрешение настроек
 fileConfig(context.config.config_file_name)
 
 target_metadata = Base.metadata
 
+def include_object(object, name, type_, reflected, compare_to):
+    # FTS5-таблица поиска и ее служебные таблицы создаются миграцией вручную
+    if type_ == "table" and reflected and name.startswith("notes_fts"):
+        return False
+    return True
+
 def get_url():
     return os.getenv("DATABASE_URL")
 
@@ -27,6 +32,7 @@ def run_migrations_offline():
         target_metadata=target_metadata,
         literal_binds=True,
         compare_type=True,
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -34,14 +40,15 @@ def run_migrations_offline():
 
 def run_migrations_online():
     """Запуск миграций в онлайн-режиме"""
-    # Используем синхронный create_engine
-    connectable = create_engine(get_url(), poolclass=pool.NullPool)
+    # Используем синхронный движок; долгие операции миграций (создание индексов) не ограничиваем по времени
+    connectable = make_engine(get_url(), poolclass=pool.NullPool, statement_timeout=0)
 
     with connectable.connect() as connection:
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
             compare_type=True,
+            include_object=include_object,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,55 @@
+"""reminders, conversation states and notes keyset index
+
+Revision ID: 2f6b8d0a4c71
+Revises: 36dd3ae87b99
+Create Date: 2026-10-17 21:05:14.227903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2f6b8d0a4c71'
+down_revision: Union[str, None] = '36dd3ae87b99'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Пока схему создавал create_all, эти таблицы могли появиться без миграций: существующие пропускаются
+    inspector = sa.inspect(op.get_bind())
+    if 'ix_notes_user_id_created_at' not in {index['name'] for index in inspector.get_indexes('notes')}:
+        op.create_index('ix_notes_user_id_created_at', 'notes', ['user_id', 'created_at', 'note_id'], unique=False)
+    if not inspector.has_table('reminders'):
+        op.create_table(
+            'reminders',
+            sa.Column('reminder_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.BigInteger(), nullable=False),
+            sa.Column('note_id', sa.Integer(), nullable=False),
+            sa.Column('remind_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['note_id'], ['notes.note_id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+            sa.PrimaryKeyConstraint('reminder_id'),
+        )
+        op.create_index('ix_reminders_remind_at', 'reminders', ['remind_at', 'reminder_id'], unique=False)
+    if not inspector.has_table('conversation_states'):
+        op.create_table(
+            'conversation_states',
+            sa.Column('user_id', sa.BigInteger(), nullable=False),
+            sa.Column('state', sa.String(length=64), nullable=False),
+            sa.Column('data', sa.Text(), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('user_id'),
+        )
+        op.create_index(op.f('ix_conversation_states_expires_at'), 'conversation_states', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_conversation_states_expires_at'), table_name='conversation_states')
+    op.drop_table('conversation_states')
+    op.drop_index('ix_reminders_remind_at', table_name='reminders')
+    op.drop_table('reminders')
+    op.drop_index('ix_notes_user_id_created_at', table_name='notes')
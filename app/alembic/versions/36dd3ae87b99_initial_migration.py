@@ -19,12 +19,30 @@ depends_on: Union[str, Sequence[str], None] = None
 
 
 def upgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    pass
-    # ### end Alembic commands ###
+    # Схема, которую создавал create_all до перехода на миграции. Если база создана им же
+    # и не отмечена через alembic stamp, существующие таблицы пропускаются
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('users'):
+        op.create_table(
+            'users',
+            sa.Column('user_id', sa.BigInteger(), nullable=False),
+            sa.Column('username', sa.String(length=255), nullable=False),
+            sa.PrimaryKeyConstraint('user_id'),
+            sa.UniqueConstraint('username'),
+        )
+    if not inspector.has_table('notes'):
+        op.create_table(
+            'notes',
+            sa.Column('note_id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.String(length=255), nullable=False),
+            sa.Column('content', sa.Text(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('user_id', sa.BigInteger(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+            sa.PrimaryKeyConstraint('note_id'),
+        )
 
 
 def downgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    pass
-    # ### end Alembic commands ###
+    op.drop_table('notes')
+    op.drop_table('users')
@@ -0,0 +1,65 @@
+"""note search indexes
+
+Revision ID: 5b1f0c7e2a94
+Revises: 2f6b8d0a4c71
+Create Date: 2026-10-17 16:20:12.418530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1f0c7e2a94'
+down_revision: Union[str, None] = '2f6b8d0a4c71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            "CREATE INDEX ix_notes_search_tsv ON notes "
+            "USING gin ((to_tsvector('simple', title || ' ' || content)))"
+        )
+        op.execute(
+            "CREATE INDEX ix_notes_search_trgm ON notes "
+            "USING gin ((title || ' ' || content) gin_trgm_ops)"
+        )
+    elif dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE notes_fts USING fts5("
+            "title, content, content='notes', content_rowid='note_id')"
+        )
+        op.execute(
+            "CREATE TRIGGER notes_fts_insert AFTER INSERT ON notes BEGIN "
+            "INSERT INTO notes_fts(rowid, title, content) VALUES (new.note_id, new.title, new.content); END"
+        )
+        op.execute(
+            "CREATE TRIGGER notes_fts_delete AFTER DELETE ON notes BEGIN "
+            "INSERT INTO notes_fts(notes_fts, rowid, title, content) "
+            "VALUES ('delete', old.note_id, old.title, old.content); END"
+        )
+        op.execute(
+            "CREATE TRIGGER notes_fts_update AFTER UPDATE ON notes BEGIN "
+            "INSERT INTO notes_fts(notes_fts, rowid, title, content) "
+            "VALUES ('delete', old.note_id, old.title, old.content); "
+            "INSERT INTO notes_fts(rowid, title, content) VALUES (new.note_id, new.title, new.content); END"
+        )
+        op.execute("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_notes_search_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_notes_search_tsv")
+    elif dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS notes_fts_update")
+        op.execute("DROP TRIGGER IF EXISTS notes_fts_delete")
+        op.execute("DROP TRIGGER IF EXISTS notes_fts_insert")
+        op.execute("DROP TABLE IF EXISTS notes_fts")
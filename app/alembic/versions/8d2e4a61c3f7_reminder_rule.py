@@ -0,0 +1,27 @@
+"""reminder rule
+
+Revision ID: 8d2e4a61c3f7
+Revises: 5b1f0c7e2a94
+Create Date: 2026-10-17 17:05:41.203117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2e4a61c3f7'
+down_revision: Union[str, None] = '5b1f0c7e2a94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('reminders', sa.Column('rule', sa.String(length=100), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('reminders') as batch_op:
+        batch_op.drop_column('rule')
@@ -0,0 +1,77 @@
+"""utc timestamps and user timezone
+
+Revision ID: c41f9b7d2e58
+Revises: 8d2e4a61c3f7
+Create Date: 2026-10-17 17:48:09.512336
+
+"""
+import os
+from datetime import datetime, timezone
+from typing import Sequence, Union
+from zoneinfo import ZoneInfo
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41f9b7d2e58'
+down_revision: Union[str, None] = '8d2e4a61c3f7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Даты заметок и напоминаний до этой миграции хранились в местном времени пользователей.
+# Пояс задан здесь, а не взят из timezones.py: миграция не должна меняться вместе с приложением
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Europe/Moscow")
+LOCAL_COLUMNS = [('notes', 'note_id', 'created_at'), ('reminders', 'reminder_id', 'remind_at')]
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('timezone', sa.String(length=64), nullable=True))
+
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for table, _, column in LOCAL_COLUMNS:
+            op.execute(
+                f"ALTER TABLE {table} ALTER COLUMN {column} TYPE timestamptz "
+                f"USING {column} AT TIME ZONE '{DEFAULT_TIMEZONE}'"
+            )
+        op.execute(
+            "ALTER TABLE conversation_states ALTER COLUMN expires_at TYPE timestamptz "
+            "USING expires_at AT TIME ZONE 'UTC'"
+        )
+    else:
+        # В SQLite время остается наивным, но теперь в UTC: пересчитываем значения построчно
+        _shift(lambda value: value.replace(tzinfo=ZoneInfo(DEFAULT_TIMEZONE)).astimezone(timezone.utc))
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for table, _, column in LOCAL_COLUMNS:
+            op.execute(
+                f"ALTER TABLE {table} ALTER COLUMN {column} TYPE timestamp "
+                f"USING {column} AT TIME ZONE '{DEFAULT_TIMEZONE}'"
+            )
+        op.execute(
+            "ALTER TABLE conversation_states ALTER COLUMN expires_at TYPE timestamp "
+            "USING expires_at AT TIME ZONE 'UTC'"
+        )
+    else:
+        _shift(lambda value: value.replace(tzinfo=timezone.utc).astimezone(ZoneInfo(DEFAULT_TIMEZONE)))
+
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('timezone')
+
+
+def _shift(convert):
+    connection = op.get_bind()
+    for table, key, column in LOCAL_COLUMNS:
+        rows = connection.execute(sa.text(f"SELECT {key}, {column} FROM {table} WHERE {column} IS NOT NULL")).all()
+        updates = [
+            {"key": row[0], "value": convert(datetime.fromisoformat(str(row[1]))).replace(tzinfo=None).isoformat(" ")}
+            for row in rows
+        ]
+        if updates:
+            connection.execute(sa.text(f"UPDATE {table} SET {column} = :value WHERE {key} = :key"), updates)
@@ -0,0 +1,38 @@
+"""notes archive
+
+Revision ID: e7a3c95b1d20
+Revises: c41f9b7d2e58
+Create Date: 2026-10-17 19:12:37.480215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a3c95b1d20'
+down_revision: Union[str, None] = 'c41f9b7d2e58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'notes_archive',
+        sa.Column('note_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('title', sa.String(length=255), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+        sa.PrimaryKeyConstraint('note_id'),
+    )
+    op.create_index('ix_notes_archive_user_id_created_at', 'notes_archive', ['user_id', 'created_at', 'note_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notes_archive_user_id_created_at', table_name='notes_archive')
+    op.drop_table('notes_archive')
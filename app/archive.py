@@ -0,0 +1,112 @@
+"""Перенос прошедших заметок из notes в notes_archive.
+
+Актуальные заметки — те, чья дата еще не наступила, — читаются постоянно, а
+прошедшие нужны только в /archive. NoteArchiver раз в интервал переносит
+заметки старше retention порциями по batch_size: каждая порция — отдельная
+короткая транзакция (INSERT ... SELECT, затем DELETE по тем же ID), так что
+блокировки не копятся, а таблица notes и ее индексы остаются размером с
+горячие данные. Заметки, на которые еще есть напоминания, не переносятся.
+"""
+import logging
+from datetime import timedelta
+
+from sqlalchemy import delete, exists, func, insert, literal, select, tuple_, union_all
+
+from database import ArchivedNote, Note, Reminder
+from timezones import utcnow
+
+logger = logging.getLogger(__name__)
+
+# Через сколько дней после даты заметка уходит в архив
+ARCHIVE_AFTER_DAYS = 30
+ARCHIVE_BATCH_SIZE = 1000
+
+
+class NoteArchiver:
+    """Переносит заметки старше retention в notes_archive.
+
+    shard=(index, count) ограничивает перенос заметками пользователей,
+    для которых abs(user_id) % count == index, как у ReminderScheduler.
+    on_archived(pairs) вызывается после коммита каждой порции со списком
+    (user_id, note_id) — чтобы сбросить кэш заметок.
+    """
+
+    def __init__(self, session_factory, retention=timedelta(days=ARCHIVE_AFTER_DAYS), batch_size=ARCHIVE_BATCH_SIZE,
+                 shard=None, on_archived=None):
+        self.Session = session_factory
+        self.retention = retention
+        self.batch_size = batch_size
+        self.shard = shard
+        self.on_archived = on_archived
+        self.archived = 0
+
+    def run(self, context=None):
+        """Переносит все подходящие заметки; возвращает их число."""
+        cutoff = utcnow() - self.retention
+        total = 0
+        while True:
+            moved = self.archive_batch(cutoff)
+            total += len(moved)
+            if moved and self.on_archived:
+                self.on_archived(moved)
+            if len(moved) < self.batch_size:
+                break
+        self.archived += total
+        if total:
+            logger.info("В архив перенесено заметок: %d", total)
+        return total
+
+    def archive_batch(self, cutoff):
+        """Переносит до batch_size заметок с датой раньше cutoff одной транзакцией."""
+        query = select(Note.note_id, Note.user_id).where(
+            Note.created_at < cutoff,
+            ~exists().where(Reminder.note_id == Note.note_id),
+        )
+        if self.shard is not None:
+            index, count = self.shard
+            query = query.where(func.abs(Note.user_id) % count == index)
+        # В PostgreSQL параллельные архиваторы пропускают чужие порции; SQLite FOR UPDATE не поддерживает
+        query = query.order_by(Note.note_id).limit(self.batch_size).with_for_update(skip_locked=True)
+
+        with self.Session() as session:
+            rows = session.execute(query).all()
+            if not rows:
+                return []
+            note_ids = [row.note_id for row in rows]
+            columns = ("note_id", "title", "content", "created_at", "user_id")
+            archived_at = literal(utcnow(), ArchivedNote.archived_at.type)
+            session.execute(
+                insert(ArchivedNote).from_select(
+                    [*columns, "archived_at"],
+                    select(*(getattr(Note, name) for name in columns), archived_at).where(Note.note_id.in_(note_ids)),
+                )
+            )
+            session.execute(
+                delete(Note).where(Note.note_id.in_(note_ids)),
+                execution_options={"synchronize_session": False},
+            )
+            session.commit()
+        return [(row.user_id, row.note_id) for row in rows]
+
+
+def past_notes_page(session, user_id, limit, after=None):
+    """Прошедшие заметки пользователя от новых к старым: из notes и notes_archive вместе.
+
+    after — ключ (created_at, note_id) последней показанной заметки. Возвращает
+    до limit + 1 строк: лишняя означает, что есть следующая страница. Каждая
+    часть UNION читает не больше limit + 1 строк по своему индексу (user_id, created_at, note_id).
+    """
+    parts = []
+    for model, condition in ((Note, Note.created_at < utcnow()), (ArchivedNote, None)):
+        query = select(model.note_id, model.title, model.content, model.created_at).where(model.user_id == user_id)
+        if condition is not None:
+            query = query.where(condition)
+        if after is not None:
+            query = query.where(tuple_(model.created_at, model.note_id) < tuple_(*after))
+        parts.append(
+            query.order_by(model.created_at.desc(), model.note_id.desc()).limit(limit + 1).subquery().select()
+        )
+    combined = union_all(*parts).subquery()
+    return session.execute(
+        select(combined).order_by(combined.c.created_at.desc(), combined.c.note_id.desc()).limit(limit + 1)
+    ).all()
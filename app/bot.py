@@ -1,14 +1,34 @@
+import logging
 import os
-from datetime import datetime
+import tempfile
+from collections import deque
+from datetime import datetime, timedelta
 
-from telegram import Update, ReplyKeyboardMarkup
+from cachetools import TTLCache
+from telegram import Bot, Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, Unauthorized
 from telegram.ext import Updater, CommandHandler, CallbackQueryHandler, CallbackContext, MessageHandler, Filters
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from database import User, Note, Base
-from dotenv import load_dotenv
-
-load_dotenv()
+from sqlalchemy import case, delete, func, select, tuple_
+from sqlalchemy.engine import make_url
+from database import ArchivedNote, User, Note, Reminder, Session, dispose_engine
+from engine import pool_stats
+from archive import NoteArchiver, past_notes_page, ARCHIVE_AFTER_DAYS as DEFAULT_ARCHIVE_AFTER_DAYS, \
+    ARCHIVE_BATCH_SIZE
+from metrics import Metrics, SamplingProfiler, TimedRequest, serve_metrics
+from ingress import IngressLimiter, CONCURRENCY as DEFAULT_INGRESS_CONCURRENCY, USER_BURST, USER_RATE
+from writebehind import NoteWriter, MAX_BATCH as DEFAULT_WRITE_BEHIND_BATCH, MAX_DELAY as DEFAULT_WRITE_BEHIND_DELAY
+from cache import NoteCache, NoteSnapshot, create_listener, NOTE_CACHE_SIZE as DEFAULT_NOTE_CACHE_SIZE, \
+    NOTE_CACHE_TTL as DEFAULT_NOTE_CACHE_TTL
+from reminders import ReminderScheduler
+from outbound import OutboundQueue, GLOBAL_RATE, CHAT_RATE
+from states import create_state_store, STATE_TTL as DEFAULT_STATE_TTL
+from search import search_notes, search_terms
+from flows import ConversationFlow, DATE_FORMAT, NEVER_FIRES_TEXT, choice, parse_date, parse_note_id, parse_note_ids, \
+    parse_repeat
+from recurrence import PRESETS, next_occurrence, parse_rule, preset_rule
+from timezones import get_zone, to_local, to_utc, user_zone, utcnow
+from transfer import FORMATS, IMPORT_MAX_SIZE, detect_format, export_notes, import_notes, read_notes
+from utils import encode_page_key, decode_page_key, format_ids, shorten
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
@@ -18,36 +38,206 @@ token = os.getenv("TOKEN")
 if not token:
     raise ValueError("TOKEN не задан в .env файле")
 
-engine = create_engine(DATABASE_URL, echo=True)
-Session = sessionmaker(bind=engine)
+# Уровень журнала: INFO — в том числе установленные напоминания, перенос в архив и состояние пула
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+logger = logging.getLogger(__name__)
+
+# threaded — Updater с пулом потоков, async — обработка обновлений в asyncio (см. aio.py),
+# webhook — прием через webhook несколькими процессами (см. webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "threaded")
+# Адрес Bot API, например локального telegram-bot-api сервера; по умолчанию api.telegram.org
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL")
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "5555"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", os.cpu_count() or 1))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+# memory — LRU с TTL в памяти процесса, sql — таблица conversation_states (переживает рестарт)
+STATE_STORE = os.getenv("STATE_STORE", "memory")
+STATE_TTL = int(os.getenv("STATE_TTL", DEFAULT_STATE_TTL))
+
+REMINDER_POLL_INTERVAL = int(os.getenv("REMINDER_POLL_INTERVAL", "30"))
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "4"))
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", GLOBAL_RATE))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", CHAT_RATE))
+# Страница из 10 заметок с обрезанными заголовком и текстом укладывается в лимит Telegram в 4096 символов
+NOTES_PAGE_SIZE = 10
+NOTE_TITLE_PREVIEW_LENGTH = 80
+NOTE_PREVIEW_LENGTH = 250
+SEARCH_PAGE_SIZE = 10
+# Через сколько секунд повторить напоминание, если Telegram так и не принял сообщение
+REMINDER_RETRY_DELAY = 60
+NOTE_CACHE_SIZE = int(os.getenv("NOTE_CACHE_SIZE", DEFAULT_NOTE_CACHE_SIZE))
+NOTE_CACHE_TTL = int(os.getenv("NOTE_CACHE_TTL", DEFAULT_NOTE_CACHE_TTL))
+# Рассылать инвалидацию кэша заметок другим процессам через LISTEN/NOTIFY (только PostgreSQL)
+NOTE_CACHE_NOTIFY = os.getenv("NOTE_CACHE_NOTIFY", "0") == "1" and make_url(DATABASE_URL).get_backend_name() == "postgresql"
+# Как часто выводить состояние пула соединений и время ожидания соединения, 0 — не выводить
+DB_POOL_STATS_INTERVAL = int(os.getenv("DB_POOL_STATS_INTERVAL", "0"))
+# Порт /metrics в формате Prometheus (в режиме webhook метрики отдает роутер на WEBHOOK_PORT), 0 — не отдавать
+METRICS_PORT = int(os.getenv("METRICS_PORT", "5555"))
+# Период выборочного профилировщика в секундах (результат на /profile), 0 — выключен
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0"))
+# Через сколько дней после даты заметка переносится в архив, 0 — не переносить
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", DEFAULT_ARCHIVE_AFTER_DAYS))
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", "3600"))
+# Входящие обновления: на пользователя RATE в секунду с запасом BURST (0 — без ограничения)
+# и не больше CONCURRENCY обработчиков одновременно (0 — без ограничения)
+INGRESS_USER_RATE = float(os.getenv("INGRESS_USER_RATE", USER_RATE))
+INGRESS_USER_BURST = int(os.getenv("INGRESS_USER_BURST", USER_BURST))
+INGRESS_CONCURRENCY = int(os.getenv("INGRESS_CONCURRENCY", DEFAULT_INGRESS_CONCURRENCY))
+# Создание и изменение заметок пакетами: коммит не позже чем через WRITE_BEHIND_DELAY_MS или по
+# WRITE_BEHIND_BATCH записей, ответ пользователю — после коммита (в режиме async не используется)
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_DELAY_MS = float(os.getenv("WRITE_BEHIND_DELAY_MS", DEFAULT_WRITE_BEHIND_DELAY * 1000))
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", DEFAULT_WRITE_BEHIND_BATCH))
 
 class NoteBot:
-    def __init__(self):
-        self.updater = Updater(token=token, use_context=True)
+    def __init__(self, bot=None, session_factory=Session, shard=None, write_behind=WRITE_BEHIND):
+        # В асинхронном режиме передаются свой bot и фабрика сессий поверх асинхронного движка
+        if bot is None:
+            # Пул как у Updater по умолчанию: 4 потока диспетчера и еще 4 соединения сверх них
+            bot = Bot(token=token, base_url=TELEGRAM_BASE_URL, request=TimedRequest(con_pool_size=8))
+        self.updater = Updater(bot=bot, use_context=True)
         self.dispatcher = self.updater.dispatcher
         self.job_queue = self.updater.job_queue
-        self.user_states = {}
-
+        self.Session = session_factory
+        self.metrics = Metrics()
+        self.metrics.install_db_hooks()
+        self.metrics.install_request_hooks()
+        self.profiler = None
+        self.ingress = IngressLimiter(
+            rate=INGRESS_USER_RATE,
+            burst=INGRESS_USER_BURST,
+            concurrency=INGRESS_CONCURRENCY,
+            on_reject=self.metrics.ingress_rejected.inc,
+        )
+        self.states = create_state_store(STATE_STORE, session_factory, ttl=STATE_TTL)
+        # Последний поисковый запрос пользователя для перелистывания результатов
+        self.searches = TTLCache(maxsize=10000, ttl=STATE_TTL)
+        self.reminders = ReminderScheduler(session_factory, shard=shard)
+        self.archiver = NoteArchiver(
+            session_factory,
+            retention=timedelta(days=ARCHIVE_AFTER_DAYS),
+            batch_size=ARCHIVE_BATCH_SIZE,
+            shard=shard,
+            on_archived=self.notes_archived,
+        )
+        self.cache = NoteCache(session_factory, maxsize=NOTE_CACHE_SIZE, ttl=NOTE_CACHE_TTL, notify=NOTE_CACHE_NOTIFY)
+        if NOTE_CACHE_NOTIFY:
+            create_listener(self.cache, DATABASE_URL).start()
+        # Отдельный Bot со своим пулом соединений, чтобы рассылка не занимала соединения обработчиков
+        self.outbound = OutboundQueue(
+            Bot(token=token, base_url=TELEGRAM_BASE_URL, request=TimedRequest(con_pool_size=SEND_WORKERS + 1)),
+            workers=SEND_WORKERS,
+            global_rate=SEND_GLOBAL_RATE,
+            chat_rate=SEND_CHAT_RATE,
+        )
+        # Поток записи работает с синхронными сессиями, поэтому в асинхронном режиме он выключен
+        self.writes = NoteWriter(
+            session_factory,
+            max_delay=WRITE_BEHIND_DELAY_MS / 1000,
+            max_batch=WRITE_BEHIND_BATCH,
+            publish=self.cache.publish,
+            on_flush=self.writes_flushed,
+        ) if write_behind else None
+        self.add_gauges()
+
+        self.flow = self.build_flow()
         self.add_handlers()
-        self.create_tables()
-
-    def create_tables(self):
-        Base.metadata.create_all(engine)
 
     def add_handlers(self):
-        self.dispatcher.add_handler(CommandHandler("start", self.start))
-        self.dispatcher.add_handler(CommandHandler("create", self.create_note_prompt))
-        self.dispatcher.add_handler(CommandHandler("update", self.update_note_prompt))
-        self.dispatcher.add_handler(CommandHandler("delete", self.delete_note_prompt))
-        self.dispatcher.add_handler(CommandHandler("remind", self.remind_note_prompt))
-        self.dispatcher.add_handler(CallbackQueryHandler(self.handle_button_click))
-        self.dispatcher.add_handler(MessageHandler(Filters.text & ~Filters.command, self.handle_message))
+        # Лимиты проверяются до замера: отклоненные обновления не попадают в гистограммы обработчиков
+        def guarded(callback):
+            return self.ingress.guard(self.metrics.timed_handler(callback))
+
+        self.dispatcher.add_handler(CommandHandler("start", guarded(self.start)))
+        self.dispatcher.add_handler(CommandHandler("create", guarded(self.create_note_prompt)))
+        self.dispatcher.add_handler(CommandHandler("update", guarded(self.update_note_prompt)))
+        self.dispatcher.add_handler(CommandHandler("delete", guarded(self.delete_note_prompt)))
+        self.dispatcher.add_handler(CommandHandler("remind", guarded(self.remind_note_prompt)))
+        self.dispatcher.add_handler(CommandHandler("search", guarded(self.search_prompt)))
+        self.dispatcher.add_handler(CommandHandler("timezone", guarded(self.timezone_command)))
+        self.dispatcher.add_handler(CommandHandler("export", guarded(self.export_command)))
+        self.dispatcher.add_handler(CommandHandler("import", guarded(self.import_prompt)))
+        self.dispatcher.add_handler(CommandHandler("archive", guarded(self.archive_command)))
+        self.dispatcher.add_handler(CallbackQueryHandler(guarded(self.handle_button_click)))
+        self.dispatcher.add_handler(MessageHandler(Filters.text & ~Filters.command, guarded(self.handle_message)))
+        self.dispatcher.add_handler(MessageHandler(Filters.document, guarded(self.handle_document)))
+
+    def periodic_jobs(self):
+        """Фоновые задачи в виде пар (callback, интервал в секундах)."""
+        return [
+            (self.reminders.poll, REMINDER_POLL_INTERVAL),
+            (self.send_reminder, 1),
+            (self.states.purge_expired, 600),
+        ] + ([(self.report_pool_stats, DB_POOL_STATS_INTERVAL)] if DB_POOL_STATS_INTERVAL else []) \
+          + ([(self.archiver.run, ARCHIVE_INTERVAL)] if ARCHIVE_AFTER_DAYS else [])
+
+    def add_jobs(self):
+        # Первый запуск сразу при старте: опрос подхватывает пропущенные за время простоя напоминания.
+        # first=0 для этого не годится: APScheduler считает его моментом, который уже прошел к добавлению задачи,
+        # и переносит первый запуск на interval позже. Поэтому next_run_time задается явно, а планировщик
+        # запускается заранее, чтобы этот момент не устарел дольше допуска на пропуск запуска
+        self.job_queue.start()
+        for callback, interval in self.periodic_jobs():
+            self.job_queue.run_repeating(
+                self.metrics.timed_job(callback), interval=interval, job_kwargs={"next_run_time": utcnow()}
+            )
+
+    def add_gauges(self):
+        gauge = self.metrics.gauge
+        gauge("notebot_update_queue_depth", "Обновления, ожидающие обработки", self.updater.update_queue.qsize)
+        gauge("notebot_scheduled_jobs", "Задачи в очереди job_queue", lambda: len(self.job_queue.jobs()))
+        gauge("notebot_reminders_pending", "Напоминания в окне планировщика", self.reminders.pending)
+        for key in ("queue_depth", "delayed", "in_flight", "sent", "failed", "retried", "throttled",
+                    "max_lag_seconds"):
+            gauge(f"notebot_outbound_{key}", f"Очередь рассылки: {key}", lambda key=key: self.outbound.stats()[key])
+        gauge("notebot_notes_archived", "Заметки, перенесенные в архив этим процессом", lambda: self.archiver.archived)
+        gauge("notebot_ingress_active", "Обработчики, выполняющиеся сейчас", lambda: self.ingress.stats()["active"])
+        gauge("notebot_ingress_users", "Пользователи с ведром ограничения", lambda: self.ingress.stats()["users"])
+        if self.writes is not None:
+            gauge("notebot_write_pending", "Записи заметок, ожидающие коммита", self.writes.pending)
+        gauge("notebot_note_cache_hit_ratio", "Доля попаданий в кэш заметок", lambda: self.cache.stats()["hit_ratio"])
+        gauge("notebot_note_cache_hits_total", "Попадания в кэш заметок", lambda: self.cache.stats()["hits"],
+              kind="counter")
+        gauge("notebot_note_cache_misses_total", "Промахи кэша заметок", lambda: self.cache.stats()["misses"],
+              kind="counter")
+        for key in ("checked_out", "overflow", "timeouts", "wait_max_ms"):
+            gauge(f"notebot_db_pool_{key}", f"Пул соединений БД: {key}", lambda key=key: self.pool_stats().get(key, 0))
+
+    def start_monitoring(self, serve=True):
+        """Запускает профилировщик (PROFILE_INTERVAL) и HTTP-сервер /metrics (METRICS_PORT).
+
+        Воркеры webhook передают serve=False: их метрики отдает роутер.
+        """
+        if PROFILE_INTERVAL:
+            self.profiler = SamplingProfiler(PROFILE_INTERVAL).start()
+        if serve and METRICS_PORT:
+            serve_metrics(self.metrics.render, METRICS_PORT, self.profiler.folded if self.profiler else None)
+
+    def pool_stats(self):
+        with self.Session() as session:
+            return pool_stats(session.get_bind())
+
+    def writes_flushed(self, rows, seconds, waits, retried):
+        outcome = "retried" if retried else "batch"
+        self.metrics.write_batch_rows.observe(outcome, rows)
+        self.metrics.write_flush_seconds.observe(outcome, seconds)
+        for wait in waits:
+            self.metrics.write_wait_seconds.observe(outcome, wait)
+
+    def report_pool_stats(self, context=None):
+        stats = self.pool_stats()
+        if stats:
+            logger.info("Пул соединений БД: %s", stats)
 
     def get_main_keyboard(self):
         buttons = [
             ["Create Note", "View Notes"],
             ["Update Note", "Delete Note"],
-            ["Set Reminder"]
+            ["Set Reminder", "Search Notes"]
         ]
         return ReplyKeyboardMarkup(buttons, resize_keyboard=True, one_time_keyboard=False)
 
@@ -55,13 +245,11 @@ class NoteBot:
         user_id = update.message.from_user.id
         username = update.message.from_user.username
 
-        with Session() as session:
-            user = session.query(User).filter_by(user_id=user_id).first()
-
-            if not user:
-                user = User(user_id=user_id, username=username)
-                session.add(user)
+        if not self.cache.user_exists(user_id):
+            with self.Session() as session:
+                session.add(User(user_id=user_id, username=username))
                 session.commit()
+            self.cache.user_added(user_id)
 
         reply_markup = self.get_main_keyboard()
         update.message.reply_text(
@@ -71,251 +259,462 @@ class NoteBot:
 
     def remind_note_prompt(self, update: Update, context: CallbackContext):
         user_id = update.callback_query.from_user.id if update.callback_query else update.message.from_user.id
-        self.user_states[user_id] = "waiting_for_note_id_for_reminder"
-        update.effective_message.reply_text("Введите ID заметки, для которой хотите установить напоминание.")
+        self.states.set(user_id, "waiting_for_note_id_for_reminder")
+        update.effective_message.reply_text(
+            "Введите ID заметки, для которой хотите установить напоминание, или несколько: 12,15,20-40."
+        )
 
     def create_note_prompt(self, update: Update, context: CallbackContext):
         user_id = update.message.from_user.id
-        self.user_states[user_id] = "waiting_for_note_title"
+        self.states.set(user_id, "waiting_for_note_title")
         update.message.reply_text("Введите заголовок заметки.")
 
     def update_note_prompt(self, update: Update, context: CallbackContext):
         user_id = update.message.from_user.id
-        self.user_states[user_id] = "waiting_for_note_id"
+        self.states.set(user_id, "waiting_for_note_id")
         update.message.reply_text("Введите ID заметки, которую вы хотите обновить.")
 
-    def set_reminder(self, user_id, note_id, remind_time):
-        with Session() as session:
-            note = session.query(Note).filter_by(note_id=note_id, user_id=user_id).first()
-            if not note:
-                return False
-
-            time_delta = (remind_time - datetime.now()).total_seconds()
-            if time_delta <= 0:
-                return False
+    def set_reminders(self, user_id, note_ids, remind_time, rule=None):
+        """Ставит напоминание на заметки note_ids одной транзакцией; возвращает ID заметок, где оно поставлено.
+
+        remind_time — aware-время первого срабатывания; rule — cron-выражение в поясе пользователя.
+        """
+        if remind_time <= utcnow():
+            return []
+
+        with self.Session() as session:
+            found = session.execute(
+                select(Note.note_id).where(Note.user_id == user_id, Note.note_id.in_(note_ids))
+            ).scalars().all()
+            if not found:
+                return []
+            reminders = self.reminders.add_many(session, user_id, found, remind_time, rule=rule)
+            reminder_ids = [reminder.reminder_id for reminder in reminders]
+            session.commit()
 
-            self.job_queue.run_once(self.send_reminder, time_delta, context=(user_id, note_id))
-            print(f"Напоминание установлено для пользователя {user_id} на {remind_time}")
-            return True
+        for reminder_id in reminder_ids:
+            self.reminders.arm(reminder_id, remind_time)
+        logger.info("Напоминание установлено для пользователя %s на %s, заметок: %d", user_id, remind_time, len(found))
+        return sorted(found)
 
     def send_reminder(self, context: CallbackContext):
-        user_id, note_id = context.job.context
-        with Session() as session:
-            note = session.query(Note).filter_by(note_id=note_id, user_id=user_id).first()
-            if note:
-                context.bot.send_message(
-                    chat_id=user_id,
-                    text=f"Напоминание о заметке:\n\nЗаголовок: {note.title}\nСодержание: {note.content}"
+        due = deque(self.reminders.pop_due())
+        try:
+            if due:
+                self.enqueue_reminders(due)
+        except Exception:
+            # Выданные из кучи напоминания уже за курсором опроса: без возврата они ждали бы рестарта
+            for _, reminder_id in due:
+                self.reminders.retry(reminder_id, REMINDER_RETRY_DELAY)
+            raise
+        finally:
+            self.reminders.flush()
+
+    def enqueue_reminders(self, due):
+        """Ставит сработавшие напоминания в очередь рассылки, забирая их из due по одному.
+
+        Если вызов прервался ошибкой, в due остаются только напоминания, которые еще не переданы дальше.
+        """
+        with self.Session() as session:
+            rows = (
+                session.query(
+                    Reminder.reminder_id, Reminder.user_id, Reminder.rule, User.timezone, Note.title, Note.content
                 )
-                print(f"Напоминание отправлено пользователю {user_id} о заметке {note_id}.")
-            else:
-                print(f"Напоминание не удалось: заметка {note_id} не найдена для пользователя {user_id}.")
+                .join(Note, Note.note_id == Reminder.note_id)
+                .join(User, User.user_id == Reminder.user_id)
+                .filter(Reminder.reminder_id.in_([reminder_id for _, reminder_id in due]))
+                .all()
+            )
+        notes = {row.reminder_id: row for row in rows}
+
+        while due:
+            remind_at, reminder_id = due[0]
+            row = notes.get(reminder_id)
+            if row is None:
+                # Заметку удалили вместе с напоминанием
+                logger.warning("Напоминание %s не удалось: заметка не найдена.", reminder_id)
+                self.reminders.ack(reminder_id)
+                due.popleft()
+                continue
+            self.outbound.send(
+                row.user_id,
+                f"Напоминание о заметке:\n\nЗаголовок: {row.title}\nСодержание: {row.content}",
+                due=remind_at,
+                on_sent=lambda reminder_id=reminder_id, row=row, remind_at=remind_at:
+                    self.reminder_sent(reminder_id, row.rule, remind_at, row.timezone),
+                on_failed=lambda error, reminder_id=reminder_id: self.reminder_failed(reminder_id, error),
+            )
+            due.popleft()
+
+    def reminder_sent(self, reminder_id, rule, remind_at, timezone=None):
+        if rule is None:
+            self.reminders.ack(reminder_id)
+            return
+        # После простоя пропущенные повторения не догоняются: следующее — ближайшее в будущем
+        next_at = next_occurrence(rule, max(remind_at, utcnow()), user_zone(timezone))
+        if next_at is None:
+            self.reminders.ack(reminder_id)
+        else:
+            self.reminders.advance(reminder_id, next_at)
+
+    def reminder_failed(self, reminder_id, error):
+        if isinstance(error, (Unauthorized, BadRequest)):
+            # Доставить уже не получится: напоминание удаляется
+            self.reminders.ack(reminder_id)
+        else:
+            self.reminders.retry(reminder_id, REMINDER_RETRY_DELAY)
 
     def delete_note_prompt(self, update: Update, context: CallbackContext):
         user_id = update.message.from_user.id
-        self.user_states[user_id] = "waiting_for_note_id_for_delete"
-        update.message.reply_text("Введите ID заметки, которую вы хотите удалить.")
-
-    def delete_note_by_id(self, user_id, note_id):
-        with Session() as session:
-            note = session.query(Note).filter_by(note_id=note_id, user_id=user_id).first()
-            if not note:
-                return False
-            session.delete(note)
+        self.states.set(user_id, "waiting_for_note_id_for_delete")
+        update.message.reply_text("Введите ID заметки, которую вы хотите удалить, или несколько: 12,15,20-40.")
+
+    def update_note(self, user_id, note_id, **values):
+        with self.Session() as session:
+            updated = session.query(Note).filter_by(note_id=note_id, user_id=user_id).update(values)
+            if updated:
+                self.cache.publish(session, user_id, note_id)
+            session.commit()
+        self.cache.invalidate_note(user_id, note_id)
+        return updated > 0
+
+    def delete_notes(self, user_id, note_ids):
+        """Удаляет заметки пользователя вместе с напоминаниями одной транзакцией; возвращает ID удаленных.
+
+        ID из /archive тоже подходят: заметки, уже перенесенные в notes_archive, удаляются оттуда.
+        """
+        with self.Session() as session:
+            session.execute(
+                delete(Reminder).where(Reminder.user_id == user_id, Reminder.note_id.in_(note_ids)),
+                execution_options={"synchronize_session": False},
+            )
+            deleted = session.execute(
+                delete(Note).where(Note.user_id == user_id, Note.note_id.in_(note_ids)).returning(Note.note_id),
+                execution_options={"synchronize_session": False},
+            ).scalars().all()
+            archived = session.execute(
+                delete(ArchivedNote)
+                .where(ArchivedNote.user_id == user_id, ArchivedNote.note_id.in_(note_ids))
+                .returning(ArchivedNote.note_id),
+                execution_options={"synchronize_session": False},
+            ).scalars().all()
+            if len(deleted) == 1:
+                self.cache.publish(session, user_id, deleted[0])
+            elif deleted:
+                self.cache.publish(session, user_id)
             session.commit()
-            return True
+        if len(deleted) == 1:
+            self.cache.invalidate_note(user_id, deleted[0])
+        elif deleted:
+            self.cache.invalidate_user(user_id)
+        return sorted(deleted + archived)
+
+    def build_flow(self):
+        return (
+            ConversationFlow(fallback=self.unknown_message)
+            .step("waiting_for_note_title", self.on_note_title)
+            .step("waiting_for_note_content", self.on_note_content)
+            .step("waiting_for_note_date", self.on_note_date, parse_date)
+            .step("waiting_for_note_id", self.on_update_note_id, parse_note_id)
+            .step("waiting_for_update_field", self.on_update_field, choice("title", "content", "date"))
+            .step("waiting_for_new_title", self.on_new_title)
+            .step("waiting_for_new_content", self.on_new_content)
+            .step("waiting_for_new_date", self.on_new_date, parse_date)
+            .step("waiting_for_note_id_for_reminder", self.on_reminder_note_ids, parse_note_ids)
+            .step("waiting_for_remind_time", self.on_remind_time, parse_date)
+            .step("waiting_for_remind_repeat", self.on_remind_repeat, parse_repeat)
+            .step("waiting_for_search_query", self.on_search_query)
+            .step("waiting_for_note_id_for_delete", self.on_delete_note_ids, parse_note_ids)
+            .step("waiting_for_import_file", self.on_import_file, kind="document")
+            .button("Create Note", self.create_note_prompt)
+            .button("View Notes", self.view_notes)
+            .button("Update Note", self.update_note_prompt)
+            .button("Delete Note", self.delete_note_prompt)
+            .button("Set Reminder", self.remind_note_prompt)
+            .button("Search Notes", self.search_prompt)
+        )
 
     def handle_message(self, update: Update, context: CallbackContext):
         user_id = update.message.from_user.id
-        text = update.message.text
+        self.flow.handle(update, context, self.states.get(user_id), update.message.text)
 
-        if user_id in self.user_states:
-            state = self.user_states[user_id]
+    def handle_document(self, update: Update, context: CallbackContext):
+        user_id = update.message.from_user.id
+        self.flow.handle(update, context, self.states.get(user_id), update.message.document, kind="document")
 
-            if state == "waiting_for_note_title":
-                context.user_data["note_title"] = text
-                self.user_states[user_id] = "waiting_for_note_content"
-                update.message.reply_text("Введите содержание заметки.")
-                return
+    def unknown_message(self, update: Update, context: CallbackContext):
+        update.message.reply_text(
+            "Я не понимаю. Выберите действие на клавиатуре или используйте команду.",
+            reply_markup=self.get_main_keyboard()
+        )
 
-            elif state == "waiting_for_note_content":
-                context.user_data["note_content"] = text
-                self.user_states[user_id] = "waiting_for_note_date"
-                update.message.reply_text("Введите дату и время заметки в формате ДД.ММ.ГГГГ ЧЧ:ММ.")
-                return
+    def on_note_title(self, update, user_id, text, data):
+        self.states.set(user_id, "waiting_for_note_content", {"note_title": text})
+        update.message.reply_text("Введите содержание заметки.")
+
+    def on_note_content(self, update, user_id, text, data):
+        data["note_content"] = text
+        self.states.set(user_id, "waiting_for_note_date", data)
+        update.message.reply_text("Введите дату и время заметки в формате ДД.ММ.ГГГГ ЧЧ:ММ.")
+
+    def on_note_date(self, update, user_id, note_date, data):
+        title, content = data["note_title"], data["note_content"]
+        created_at = to_utc(note_date, self.cache.user_zone(user_id))
+        text = (
+            "Заметка успешно создана!"
+            f"\nЗаголовок: {title}"
+            f"\nСодержание: {content}"
+            f"\nДата: {note_date.strftime(DATE_FORMAT)}"
+        )
 
-            elif state == "waiting_for_note_date":
-                try:
-                    note_date = datetime.strptime(text, "%d.%m.%Y %H:%M")
-                    context.user_data["note_date"] = note_date
-
-                    with Session() as session:
-                        note = Note(
-                            title=context.user_data["note_title"],
-                            content=context.user_data["note_content"],
-                            created_at=context.user_data["note_date"],
-                            user_id=user_id,
-                        )
-                        session.add(note)
-                        session.commit()
-
-                    update.message.reply_text(
-                        "Заметка успешно создана!"
-                        f"\nЗаголовок: {context.user_data['note_title']}"
-                        f"\nСодержание: {context.user_data['note_content']}"
-                        f"\nДата: {context.user_data['note_date'].strftime('%d.%m.%Y %H:%M')}"
-                    )
-
-                    self.reset_user_state(user_id, context)
-                except ValueError:
-                    update.message.reply_text("Неверный формат даты. Введите в формате ДД.ММ.ГГГГ ЧЧ:ММ.")
-                return
+        if self.writes is None:
+            with self.Session() as session:
+                note = Note(title=title, content=content, created_at=created_at, user_id=user_id)
+                session.add(note)
+                session.commit()
+                self.cache.put_note(NoteSnapshot(note.note_id, user_id, title, content, created_at))
+            update.message.reply_text(text)
+        else:
+            chat_id = update.effective_chat.id
 
-            elif state == "waiting_for_note_id":
-                try:
-                    note_id = int(text)
-                    with Session() as session:
-                        note = session.query(Note).filter_by(note_id=note_id, user_id=user_id).first()
-
-                        if not note:
-                            update.message.reply_text("Заметка с таким ID не найдена. Попробуйте снова.")
-                            return
-
-                        context.user_data["note"] = note
-                        self.user_states[user_id] = "waiting_for_update_field"
-                        update.message.reply_text(
-                            "Что вы хотите обновить? Введите одно из: title, content, date."
-                        )
-                except ValueError:
-                    update.message.reply_text("ID должен быть числом. Попробуйте снова.")
-                return
+            def created(note_id):
+                self.cache.put_note(NoteSnapshot(note_id, user_id, title, content, created_at))
+                self.outbound.send(chat_id, text)
 
-            elif state == "waiting_for_update_field":
-                field = text.lower()
-                if field in ["title", "content", "date"]:
-                    context.user_data["update_field"] = field
-                    self.user_states[user_id] = f"waiting_for_new_{field}"
-                    update.message.reply_text(f"Введите новое значение для {field}.")
-                else:
-                    update.message.reply_text("Некорректный выбор. Введите одно из: title, content, date.")
-                return
+            self.writes.create(user_id, title, content, created_at, on_done=created,
+                               on_failed=lambda error: self.write_failed(chat_id, error))
 
-            elif state == "waiting_for_new_title":
-                new_title = text
-                with Session() as session:
-                    note = context.user_data.get("note")
-                    note.title = new_title
-                    session.merge(note)
-                    session.commit()
-                update.message.reply_text(f"Заголовок заметки обновлен на '{new_title}'.")
-                self.reset_user_state(user_id, context)
-                return
+        self.reset_user_state(user_id)
 
-            elif state == "waiting_for_new_content":
-                new_content = text
-                with Session() as session:
-                    note = context.user_data.get("note")
-                    note.content = new_content
-                    session.merge(note)
-                    session.commit()
-                update.message.reply_text("Содержание заметки обновлено.")
-                self.reset_user_state(user_id, context)
-                return
+    def on_update_note_id(self, update, user_id, note_id, data):
+        note = self.cache.get_note(user_id, note_id)
+        if not note:
+            update.message.reply_text("Заметка с таким ID не найдена. Попробуйте снова.")
+            return
 
-            elif state == "waiting_for_note_id_for_reminder":
-                try:
-                    note_id = int(text)
-                    with Session() as session:
-                        note = session.query(Note).filter_by(note_id=note_id, user_id=user_id).first()
-                        if not note:
-                            update.message.reply_text("Заметка с таким ID не найдена. Попробуйте снова.")
-                            return
-
-                        context.user_data["note"] = note
-                        self.user_states[user_id] = "waiting_for_remind_time"
-                        update.message.reply_text(
-                            "Введите время напоминания в формате ДД.ММ.ГГГГ ЧЧ:ММ."
-                        )
-                except ValueError:
-                    update.message.reply_text("ID должен быть числом. Попробуйте снова.")
-                return
+        self.states.set(user_id, "waiting_for_update_field", {"note_id": note.note_id})
+        update.message.reply_text(
+            "Что вы хотите обновить? Введите одно из: title, content, date."
+        )
 
-            elif state == "waiting_for_remind_time":
-                try:
-                    remind_time = datetime.strptime(text, "%d.%m.%Y %H:%M")
-                    now = datetime.now()
-                    if remind_time < now:
-                        update.message.reply_text("Время напоминания не может быть в прошлом. Попробуйте снова.")
-                        return
-
-                    note = context.user_data.get("note")
-                    if self.set_reminder(user_id, note.note_id, remind_time):
-                        update.message.reply_text(
-                            f"Напоминание для заметки '{note.title}' установлено на {remind_time.strftime('%d.%m.%Y %H:%M')}."
-                        )
-                        self.reset_user_state(user_id, context)
-                    else:
-                        update.message.reply_text("Не удалось установить напоминание. Попробуйте снова.")
-                except ValueError:
-                    update.message.reply_text("Неверный формат даты. Введите в формате ДД.ММ.ГГГГ ЧЧ:ММ.")
-                return
+    def on_update_field(self, update, user_id, field, data):
+        self.states.set(user_id, f"waiting_for_new_{field}", data)
+        update.message.reply_text(f"Введите новое значение для {field}.")
 
-            elif state == "waiting_for_new_date":
-                try:
-                    new_date = datetime.strptime(text, "%d.%m.%Y %H:%M")
-                    with Session() as session:
-                        note = context.user_data.get("note")
-                        note.created_at = new_date
-                        session.merge(note)
-                        session.commit()
-                    update.message.reply_text(
-                        f"Дата и время заметки обновлены на {new_date.strftime('%d.%m.%Y %H:%M')}."
-                    )
-                    self.reset_user_state(user_id, context)
-                except ValueError:
-                    update.message.reply_text(
-                        "Неверный формат даты. Введите в формате ДД.ММ.ГГГГ ЧЧ:ММ."
-                    )
-                return
-            elif state == "waiting_for_note_id_for_delete":
-                try:
-                    note_id = int(text)
-                    if self.delete_note_by_id(user_id, note_id):
-                        update.message.reply_text(f"Заметка с ID {note_id} успешно удалена.")
-                    else:
-                        update.message.reply_text("Заметка с таким ID не найдена. Попробуйте снова.")
-                    self.reset_user_state(user_id, context)
-                except ValueError:
-                    update.message.reply_text("ID должен быть числом. Попробуйте снова.")
+    def on_new_title(self, update, user_id, new_title, data):
+        self.change_note(update, user_id, data["note_id"], f"Заголовок заметки обновлен на '{new_title}'.",
+                         title=new_title)
+
+    def on_new_content(self, update, user_id, text, data):
+        self.change_note(update, user_id, data["note_id"], "Содержание заметки обновлено.", content=text)
+
+    def on_new_date(self, update, user_id, new_date, data):
+        self.change_note(
+            update, user_id, data["note_id"], f"Дата и время заметки обновлены на {new_date.strftime(DATE_FORMAT)}.",
+            created_at=to_utc(new_date, self.cache.user_zone(user_id)),
+        )
+
+    def change_note(self, update, user_id, note_id, done_text, **values):
+        """Изменяет заметку и отвечает done_text; в режиме write-behind — после коммита пакета."""
+        not_found_text = "Заметка с таким ID не найдена."
+        if self.writes is None:
+            updated = self.update_note(user_id, note_id, **values)
+            update.message.reply_text(done_text if updated else not_found_text)
+        else:
+            chat_id = update.effective_chat.id
+
+            def changed(updated):
+                self.cache.invalidate_note(user_id, note_id)
+                self.outbound.send(chat_id, done_text if updated else not_found_text)
+
+            self.writes.update(user_id, note_id, values, on_done=changed,
+                               on_failed=lambda error: self.write_failed(chat_id, error))
+        self.reset_user_state(user_id)
+
+    def write_failed(self, chat_id, error):
+        logger.warning("Не удалось сохранить заметку для чата %s: %s", chat_id, error)
+        self.outbound.send(chat_id, "Не удалось сохранить заметку. Попробуйте снова.")
+
+    def on_reminder_note_ids(self, update, user_id, note_ids, data):
+        if len(note_ids) == 1:
+            note = self.cache.get_note(user_id, note_ids[0])
+            titles = {note.note_id: note.title} if note else {}
+        else:
+            with self.Session() as session:
+                titles = dict(session.execute(
+                    select(Note.note_id, Note.title).where(Note.user_id == user_id, Note.note_id.in_(note_ids))
+                ).all())
+        if not titles:
+            update.message.reply_text("Заметки с такими ID не найдены. Попробуйте снова.")
+            return
+
+        found = sorted(titles)
+        self.states.set(
+            user_id,
+            "waiting_for_remind_time",
+            {"note_ids": found, "note_title": titles[found[0]] if len(found) == 1 else None},
+        )
+        missing = sorted(set(note_ids) - set(found))
+        update.message.reply_text(
+            (f"Не найдены заметки: {format_ids(missing)}.\n" if missing else "")
+            + "Введите время напоминания в формате ДД.ММ.ГГГГ ЧЧ:ММ."
+        )
+
+    def on_remind_time(self, update, user_id, remind_time, data):
+        if to_utc(remind_time, self.cache.user_zone(user_id)) < utcnow():
+            update.message.reply_text("Время напоминания не может быть в прошлом. Попробуйте снова.")
+            return
+
+        data["remind_at"] = remind_time.strftime(DATE_FORMAT)
+        self.states.set(user_id, "waiting_for_remind_repeat", data)
+        update.message.reply_text(
+            "Как повторять напоминание? Введите once, daily, weekly, monthly "
+            "или cron-выражение (например, 0 9 * * 1-5 — по будням в 9:00)."
+        )
+
+    def on_remind_repeat(self, update, user_id, repeat, data):
+        remind_time = datetime.strptime(data["remind_at"], DATE_FORMAT)
+        rule = None
+        if repeat in PRESETS:
+            rule = preset_rule(repeat, remind_time)
+        elif repeat is not None:
+            rule = repeat
+            remind_time = parse_rule(rule).first_at_or_after(remind_time)
+            if remind_time is None:
+                # Время уже выбрано, поэтому заново спрашиваем только правило; состояние не меняется
+                update.message.reply_text(NEVER_FIRES_TEXT)
                 return
 
-        if text == "Create Note":
-            self.create_note_prompt(update, context)
-        elif text == "Set Reminder":
-            self.remind_note_prompt(update, context)
-        elif text == "Create Note":
-            self.create_note_prompt(update, context)
-        elif text == "View Notes":
-            self.view_notes(update, context)
-        elif text == "Update Note":
-            self.update_note_prompt(update, context)
-        elif text == "Delete Note":
-            self.delete_note_prompt(update, context)
+        note_ids = data["note_ids"]
+        zone = self.cache.user_zone(user_id)
+        done = self.set_reminders(user_id, note_ids, to_utc(remind_time, zone), rule=rule)
+        if done:
+            target = f"заметки '{data['note_title']}'" if data.get("note_title") else f"заметок {format_ids(done)}"
+            missing = sorted(set(note_ids) - set(done))
+            update.message.reply_text(
+                f"Напоминание для {target} установлено на {remind_time.strftime(DATE_FORMAT)}"
+                + (f" и будет повторяться ({rule})." if rule else ".")
+                + (f"\nНе найдены заметки: {format_ids(missing)}." if missing else "")
+            )
+            self.reset_user_state(user_id)
+        else:
+            del data["remind_at"]
+            self.states.set(user_id, "waiting_for_remind_time", data)
+            update.message.reply_text("Не удалось установить напоминание. Введите время напоминания снова.")
+
+    def on_search_query(self, update, user_id, text, data):
+        self.reset_user_state(user_id)
+        self.search(update, user_id, text)
+
+    def on_delete_note_ids(self, update, user_id, note_ids, data):
+        deleted = self.delete_notes(user_id, note_ids)
+        missing = sorted(set(note_ids) - set(deleted))
+        if not deleted:
+            update.message.reply_text("Заметки с такими ID не найдены. Попробуйте снова.")
+        elif len(note_ids) == 1:
+            update.message.reply_text(f"Заметка с ID {deleted[0]} успешно удалена.")
         else:
             update.message.reply_text(
-                "Я не понимаю. Выберите действие на клавиатуре или используйте команду.",
-                reply_markup=self.get_main_keyboard()
+                f"Удалено заметок: {len(deleted)} ({format_ids(deleted)})."
+                + (f"\nНе найдены: {format_ids(missing)}." if missing else "")
+            )
+        self.reset_user_state(user_id)
+
+    def timezone_command(self, update: Update, context: CallbackContext):
+        user_id = update.message.from_user.id
+        if not context.args:
+            zone = self.cache.user_zone(user_id)
+            local = to_local(utcnow(), zone)
+            update.message.reply_text(
+                f"Ваш часовой пояс: {zone.key}, сейчас {local.strftime(DATE_FORMAT)}. "
+                "Сменить: /timezone <пояс>, например /timezone Asia/Yekaterinburg."
+            )
+            return
+        if not self.cache.user_exists(user_id):
+            update.message.reply_text("Сначала выполните /start.")
+            return
+
+        name = context.args[0]
+        try:
+            zone = get_zone(name)
+        except ValueError:
+            update.message.reply_text(f"Неизвестный часовой пояс {name}. Укажите пояс IANA, например Europe/Moscow.")
+            return
+
+        with self.Session() as session:
+            session.query(User).filter_by(user_id=user_id).update({"timezone": zone.key})
+            self.cache.publish(session, user_id)
+            session.commit()
+        self.cache.invalidate_user(user_id)
+        update.message.reply_text(
+            f"Часовой пояс установлен: {zone.key}, сейчас {to_local(utcnow(), zone).strftime(DATE_FORMAT)}. "
+            "Уже созданные повторяющиеся напоминания сработают в новом поясе со следующего раза."
+        )
+
+    def export_command(self, update: Update, context: CallbackContext):
+        fmt = (context.args[0].lower() if context.args else "jsonl")
+        if fmt not in FORMATS:
+            update.message.reply_text(f"Формат экспорта: {' или '.join(FORMATS)}, например /export csv.")
+            return
+
+        user_id = update.message.from_user.id
+        out, count = export_notes(self.Session, user_id, fmt, self.cache.user_zone(user_id))
+        with out:
+            if not count:
+                update.message.reply_text("У вас нет заметок.")
+                return
+            update.message.reply_document(
+                document=out, filename=f"notes.{fmt}", caption=f"Экспортировано заметок: {count}."
             )
 
-    def reset_user_state(self, user_id, context):
-        if user_id in self.user_states:
-            del self.user_states[user_id]
-        context.user_data.clear()
+    def import_prompt(self, update: Update, context: CallbackContext):
+        user_id = update.message.from_user.id
+        if not self.cache.user_exists(user_id):
+            update.message.reply_text("Сначала выполните /start.")
+            return
+        self.states.set(user_id, "waiting_for_import_file")
+        update.message.reply_text(
+            "Отправьте файл .jsonl или .csv с полями title, content и created_at (ДД.ММ.ГГГГ ЧЧ:ММ)."
+        )
+
+    def on_import_file(self, update, user_id, document, data):
+        fmt = detect_format(document.file_name)
+        if fmt is None:
+            update.message.reply_text("Поддерживаются файлы .jsonl и .csv. Отправьте другой файл.")
+            return
+        if document.file_size and document.file_size > IMPORT_MAX_SIZE:
+            update.message.reply_text("Файл больше 20 МБ. Разбейте его на части.")
+            return
+        self.reset_user_state(user_id)
+
+        status = update.message.reply_text("Импорт начат...")
+
+        def progress(imported, skipped):
+            status.edit_text(f"Импортировано заметок: {imported}, пропущено строк: {skipped}...")
+
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as upload:
+            document.get_file().download(out=upload)
+            upload.seek(0)
+            records = read_notes(upload, fmt, self.cache.user_zone(user_id))
+            imported, skipped = import_notes(self.Session, user_id, records, progress=progress)
+
+        status.edit_text(f"Импорт завершен. Импортировано заметок: {imported}, пропущено строк: {skipped}.")
+
+    def reset_user_state(self, user_id):
+        self.states.delete(user_id)
 
     def handle_button_click(self, update: Update, context: CallbackContext):
         query = update.callback_query
 
-        if query.data == "create_note":
+        if query.data.startswith("notes:"):
+            _, direction, key = query.data.split(":", 2)
+            self.show_notes_page(query, direction, decode_page_key(key))
+        elif query.data.startswith("archive:"):
+            key = query.data.split(":", 1)[1]
+            self.show_archive_page(query, decode_page_key(key) if key else None)
+        elif query.data.startswith("search:"):
+            self.show_search_page(query, int(query.data.split(":", 1)[1]))
+        elif query.data == "create_note":
             self.create_note_prompt(query, context)
         elif query.data == "view_notes":
             self.view_notes(query, context)
@@ -336,48 +735,223 @@ class NoteBot:
         else:
             return update.message.reply_text("Не удалось определить пользователя.")
 
-        with Session() as session:
-            user = session.query(User).filter_by(user_id=user_id).first()
+        now = utcnow()
+        with self.Session() as session:
+            total, active = (
+                session.query(func.count(Note.note_id), func.count(case((Note.created_at >= now, 1))))
+                .filter(Note.user_id == user_id)
+                .one()
+            )
 
-            if not user or not user.notes:
-                if update.callback_query:
-                    update.callback_query.edit_message_text("У вас нет заметок.")
-                else:
-                    update.message.reply_text("У вас нет заметок.")
-                return
+        if not total:
+            message, reply_markup = "У вас нет заметок.", None
+        elif not active:
+            message, reply_markup = "У вас нет актуальных заметок. Прошедшие — по команде /archive.", None
+        else:
+            message, reply_markup = self.render_notes_page(user_id)
 
-            now = datetime.now()
-            active_notes = (
-                session.query(Note)
-                .filter(Note.user_id == user_id, Note.created_at >= now)
-                .order_by(Note.created_at)
-                .all()
-            )
+        if update.callback_query:
+            update.callback_query.edit_message_text(message, reply_markup=reply_markup)
+        else:
+            update.message.reply_text(message, reply_markup=reply_markup)
 
-            if not active_notes:
-                if update.callback_query:
-                    update.callback_query.edit_message_text("У вас нет актуальных заметок.")
-                else:
-                    update.message.reply_text("У вас нет актуальных заметок.")
-                return
+    def show_notes_page(self, query, direction, key):
+        user_id = query.from_user.id
+        if direction == "next":
+            message, reply_markup = self.render_notes_page(user_id, after=key)
+        else:
+            message, reply_markup = self.render_notes_page(user_id, before=key)
+        if message is None:
+            # Заметки на соседней странице успели удалить или они устарели: начинаем сначала
+            message, reply_markup = self.render_notes_page(user_id)
+        query.answer()
+        query.edit_message_text(message or "У вас нет актуальных заметок.", reply_markup=reply_markup)
+
+    def format_notes(self, notes, zone):
+        return "\n\n".join(
+            [
+                f"ID: {note.note_id}\nЗаголовок: {shorten(note.title, NOTE_TITLE_PREVIEW_LENGTH)}\n"
+                f"Содержание: {shorten(note.content, NOTE_PREVIEW_LENGTH)}\n"
+                f"Дата: {to_local(note.created_at, zone).strftime(DATE_FORMAT)}"
+                for note in notes
+            ]
+        )
 
-            message = "\n\n".join(
-                [
-                    f"ID: {note.note_id}\nЗаголовок: {note.title}\nСодержание: {note.content}\n"
-                    f"Дата: {note.created_at.strftime('%d.%m.%Y %H:%M')}"
-                    for note in active_notes
-                ]
-            )
+    def search_prompt(self, update: Update, context: CallbackContext):
+        user_id = update.message.from_user.id
+        if context.args:
+            self.search(update, user_id, " ".join(context.args))
+            return
+        self.states.set(user_id, "waiting_for_search_query")
+        update.message.reply_text("Введите слова для поиска по заметкам.")
+
+    def search(self, update: Update, user_id, query_text):
+        if not search_terms(query_text):
+            update.message.reply_text("Запрос должен содержать хотя бы одно слово.")
+            return
+        self.searches[user_id] = query_text
+        message, reply_markup = self.render_search_page(user_id, query_text, 0)
+        update.message.reply_text(message, reply_markup=reply_markup)
+
+    def show_search_page(self, query, offset):
+        query_text = self.searches.get(query.from_user.id)
+        query.answer()
+        if query_text is None:
+            query.edit_message_text("Результаты поиска устарели. Повторите поиск командой /search.")
+            return
+        message, reply_markup = self.render_search_page(query.from_user.id, query_text, offset)
+        query.edit_message_text(message, reply_markup=reply_markup)
+
+    def render_search_page(self, user_id, query_text, offset):
+        with self.Session() as session:
+            notes = search_notes(session, user_id, query_text, SEARCH_PAGE_SIZE, offset)
+        if not notes:
+            return f"По запросу «{shorten(query_text, 50)}» ничего не найдено.", None
+
+        has_next = len(notes) > SEARCH_PAGE_SIZE
+        message = f"Результаты поиска «{shorten(query_text, 50)}»:\n\n" + self.format_notes(
+            notes[:SEARCH_PAGE_SIZE], self.cache.user_zone(user_id)
+        )
 
-            if update.callback_query:
-                update.callback_query.edit_message_text(message)
-            else:
-                update.message.reply_text(message)
+        buttons = []
+        if offset:
+            buttons.append(InlineKeyboardButton(
+                "« Назад", callback_data=f"search:{max(offset - SEARCH_PAGE_SIZE, 0)}"
+            ))
+        if has_next:
+            buttons.append(InlineKeyboardButton("Вперед »", callback_data=f"search:{offset + SEARCH_PAGE_SIZE}"))
+        return message, InlineKeyboardMarkup([buttons]) if buttons else None
+
+    def render_notes_page(self, user_id, after=None, before=None):
+        """Страница актуальных заметок после ключа after или перед ключом before.
+
+        Один запрос по индексу (user_id, created_at, note_id); лишняя строка в LIMIT
+        показывает, есть ли следующая страница.
+        """
+        key = tuple_(Note.created_at, Note.note_id)
+        query = select(Note.note_id, Note.title, Note.content, Note.created_at).where(
+            Note.user_id == user_id, Note.created_at >= utcnow()
+        )
+        if before is not None:
+            query = query.where(key < tuple_(*before)).order_by(Note.created_at.desc(), Note.note_id.desc())
+        else:
+            if after is not None:
+                query = query.where(key > tuple_(*after))
+            query = query.order_by(Note.created_at, Note.note_id)
+
+        with self.Session() as session:
+            notes = session.execute(query.limit(NOTES_PAGE_SIZE + 1)).all()
+        if not notes:
+            return None, None
+
+        has_more = len(notes) > NOTES_PAGE_SIZE
+        notes = notes[:NOTES_PAGE_SIZE]
+        if before is not None:
+            notes.reverse()
+            has_prev, has_next = has_more, True
+        else:
+            has_prev, has_next = after is not None, has_more
+
+        message = self.format_notes(notes, self.cache.user_zone(user_id))
+
+        buttons = []
+        if has_prev:
+            first = notes[0]
+            buttons.append(InlineKeyboardButton(
+                "« Назад", callback_data=f"notes:prev:{encode_page_key(first.created_at, first.note_id)}"
+            ))
+        if has_next:
+            last = notes[-1]
+            buttons.append(InlineKeyboardButton(
+                "Вперед »", callback_data=f"notes:next:{encode_page_key(last.created_at, last.note_id)}"
+            ))
+        return message, InlineKeyboardMarkup([buttons]) if buttons else None
+
+    def archive_command(self, update: Update, context: CallbackContext):
+        message, reply_markup = self.render_archive_page(update.message.from_user.id)
+        update.message.reply_text(message or "Прошедших заметок нет.", reply_markup=reply_markup)
+
+    def show_archive_page(self, query, after):
+        message, reply_markup = self.render_archive_page(query.from_user.id, after)
+        query.answer()
+        query.edit_message_text(message or "Прошедших заметок нет.", reply_markup=reply_markup)
+
+    def render_archive_page(self, user_id, after=None):
+        """Страница прошедших заметок, от новых к старым, после ключа after."""
+        with self.Session() as session:
+            notes = past_notes_page(session, user_id, NOTES_PAGE_SIZE, after)
+        if not notes:
+            return None, None
+
+        has_next = len(notes) > NOTES_PAGE_SIZE
+        notes = notes[:NOTES_PAGE_SIZE]
+        message = "Прошедшие заметки:\n\n" + self.format_notes(notes, self.cache.user_zone(user_id))
+
+        buttons = []
+        if after is not None:
+            buttons.append(InlineKeyboardButton("« К новым", callback_data="archive:"))
+        if has_next:
+            last = notes[-1]
+            buttons.append(InlineKeyboardButton(
+                "Ранее »", callback_data=f"archive:{encode_page_key(last.created_at, last.note_id)}"
+            ))
+        return message, InlineKeyboardMarkup([buttons]) if buttons else None
+
+    def notes_archived(self, pairs):
+        for user_id, note_id in pairs:
+            self.cache.invalidate_note(user_id, note_id)
 
     def run(self):
+        self.start_monitoring()
+        self.add_jobs()
+        self.outbound.start()
         self.updater.start_polling()
         self.updater.idle()
+        if self.writes is not None:
+            self.writes.stop()
+        self.outbound.stop()
+        self.reminders.flush()
+
+def run_async():
+    from aio import AsyncRequest, AsyncRunner, async_session_factory
+
+    bot = NoteBot(
+        bot=Bot(token=token, base_url=TELEGRAM_BASE_URL, request=AsyncRequest()),
+        session_factory=async_session_factory(DATABASE_URL),
+        write_behind=False,
+    )
+    bot.start_monitoring()
+    AsyncRunner(bot).run()
+
+def run_webhook():
+    from webhook import WebhookRouter
+
+    if not WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL не задан в .env файле")
+
+    def prepare():
+        # Соединения пула не должны достаться воркерам после fork
+        dispose_engine()
+
+    WebhookRouter(
+        lambda shard: NoteBot(shard=shard),
+        token,
+        WEBHOOK_URL,
+        port=WEBHOOK_PORT,
+        workers=WEBHOOK_WORKERS,
+        secret=WEBHOOK_SECRET,
+        base_url=TELEGRAM_BASE_URL,
+        prepare=prepare,
+    ).run()
 
 if __name__ == "__main__":
-    bot = NoteBot()
-    bot.run()
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # APScheduler пишет INFO о каждом запуске задачи, а send_reminder запускается раз в секунду
+    logging.getLogger("apscheduler").setLevel(max(logging.WARNING, logging.getLevelName(LOG_LEVEL)))
+    if BOT_MODE == "async":
+        run_async()
+    elif BOT_MODE == "webhook":
+        run_webhook()
+    else:
+        bot = NoteBot()
+        bot.run()
@@ -0,0 +1,199 @@
+import logging
+import select as io_select
+import threading
+from collections import namedtuple
+
+from cachetools import TTLCache
+from sqlalchemy import select, text
+from sqlalchemy.pool import NullPool
+
+from database import Note, User
+from engine import make_engine
+from timezones import user_zone
+
+logger = logging.getLogger(__name__)
+
+# Неизменяемый снимок заметки: не привязан к сессии и безопасен для разделения между потоками
+NoteSnapshot = namedtuple("NoteSnapshot", "note_id user_id title content created_at")
+
+NOTIFY_CHANNEL = "note_cache"
+NOTE_CACHE_SIZE = 10000
+# Страховка на случай изменения заметок в обход NoteCache, секунды
+NOTE_CACHE_TTL = 300
+
+
+class NoteCache:
+    """Кэш сквозного чтения заметок по (user_id, note_id) и регистрации и часового пояса пользователя.
+
+    Кэшируются только найденные записи: промах всегда идет в БД, поэтому новая
+    заметка видна сразу. Изменяющий код обязан вызвать invalidate_note после
+    коммита; publish в той же транзакции рассылает инвалидацию другим процессам
+    через NOTIFY (см. NotifyListener).
+    """
+
+    def __init__(self, session_factory, maxsize=NOTE_CACHE_SIZE, ttl=NOTE_CACHE_TTL, notify=False):
+        self.Session = session_factory
+        self.notify = notify
+        self._notes = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._users = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Растет при каждой инвалидации: значение, прочитанное из БД до нее, в кэш не кладется
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_note(self, user_id, note_id):
+        """Снимок заметки пользователя или None, если такой нет."""
+        key = (user_id, note_id)
+        with self._lock:
+            note = self._notes.get(key)
+            if note is not None:
+                self.hits += 1
+                return note
+            self.misses += 1
+            generation = self._generation
+
+        # Запрос к БД вне блокировки: в асинхронном режиме он уступает цикл событий другим обработчикам
+        with self.Session() as session:
+            row = session.execute(
+                select(Note.note_id, Note.user_id, Note.title, Note.content, Note.created_at)
+                .where(Note.note_id == note_id, Note.user_id == user_id)
+            ).first()
+        if row is None:
+            return None
+        note = NoteSnapshot(*row)
+        self._fill(self._notes, key, note, generation)
+        return note
+
+    def put_note(self, note):
+        """Кладет в кэш только что созданную или полностью известную заметку."""
+        with self._lock:
+            self._notes[(note.user_id, note.note_id)] = note
+
+    def user_exists(self, user_id):
+        return self._user_timezone(user_id) is not None
+
+    def user_zone(self, user_id):
+        """ZoneInfo пользователя; для незарегистрированных и не выбравших пояс — пояс по умолчанию."""
+        return user_zone(self._user_timezone(user_id))
+
+    def user_added(self, user_id, timezone=None):
+        with self._lock:
+            self._users[user_id] = timezone or ""
+
+    def _user_timezone(self, user_id):
+        """Пояс пользователя: "" — по умолчанию, None — пользователь не зарегистрирован."""
+        with self._lock:
+            value = self._users.get(user_id)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+            generation = self._generation
+
+        with self.Session() as session:
+            row = session.execute(select(User.timezone).where(User.user_id == user_id)).first()
+        if row is None:
+            return None
+        value = row.timezone or ""
+        self._fill(self._users, user_id, value, generation)
+        return value
+
+    def invalidate_note(self, user_id, note_id):
+        with self._lock:
+            self._generation += 1
+            self._notes.pop((user_id, note_id), None)
+
+    def invalidate_user(self, user_id):
+        """Забывает пользователя и все его заметки."""
+        with self._lock:
+            self._generation += 1
+            self._users.pop(user_id, None)
+            for key in [key for key in self._notes.keys() if key[0] == user_id]:
+                self._notes.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._notes.clear()
+            self._users.clear()
+
+    def publish(self, session, user_id, note_id=None):
+        """Ставит в транзакцию session уведомление для других процессов; уйдет при коммите."""
+        if not self.notify:
+            return
+        payload = str(user_id) if note_id is None else f"{user_id}:{note_id}"
+        session.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": NOTIFY_CHANNEL, "payload": payload})
+
+    def handle_notification(self, payload):
+        user_id, _, note_id = payload.partition(":")
+        if note_id:
+            self.invalidate_note(int(user_id), int(note_id))
+        else:
+            self.invalidate_user(int(user_id))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "notes": len(self._notes),
+                "users": len(self._users),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def _fill(self, cache, key, value, generation):
+        with self._lock:
+            if self._generation == generation:
+                cache[key] = value
+
+
+class NotifyListener:
+    """Поток, слушающий LISTEN note_cache в PostgreSQL и сбрасывающий записи NoteCache.
+
+    Работает на отдельном соединении вне пула; при обрыве переподключается.
+    """
+
+    def __init__(self, cache, engine, reconnect_delay=5):
+        self.cache = cache
+        self.engine = engine
+        self.reconnect_delay = reconnect_delay
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="note-cache-listener", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join(self.reconnect_delay + 1)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except Exception as error:
+                logger.warning("LISTEN %s прерван: %s", NOTIFY_CHANNEL, error)
+                # Пока соединения не было, уведомления могли потеряться
+                self.cache.clear()
+                self._stopped.wait(self.reconnect_delay)
+
+    def _listen(self):
+        connection = self.engine.raw_connection()
+        try:
+            dbapi_connection = connection.dbapi_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            while not self._stopped.is_set():
+                if io_select.select([dbapi_connection], [], [], 1)[0]:
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        self.cache.handle_notification(dbapi_connection.notifies.pop(0).payload)
+        finally:
+            connection.invalidate()
+
+
+def create_listener(cache, database_url):
+    return NotifyListener(cache, make_engine(database_url, poolclass=NullPool))
@@ -1,21 +1,49 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, DateTime, BigInteger
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, BigInteger, Index, TypeDecorator
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
-from dotenv import load_dotenv
+from datetime import timezone
 import os
+import threading
 
-load_dotenv()
+from engine import make_engine
+from timezones import utcnow
 
+# .env загружает engine.py — первый модуль, читающий окружение
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 Base = declarative_base()
 
+class UTCDateTime(TypeDecorator):
+    """Момент времени в UTC: в PostgreSQL — timestamptz, в SQLite — наивное UTC-время.
+
+    Наивные значения при записи считаются UTC; при чтении всегда возвращается aware UTC,
+    поэтому сравнивать их можно с timezones.utcnow() в любой СУБД.
+    """
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        value = value.astimezone(timezone.utc)
+        return value if dialect.name == "postgresql" else value.replace(tzinfo=None)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
+
 class User(Base):
     __tablename__ = 'users'
 
     user_id = Column(BigInteger, primary_key=True)
     username = Column(String(255), unique=True, nullable=False)
+    # Имя пояса IANA, например Asia/Yekaterinburg; NULL — timezones.DEFAULT_TIMEZONE
+    timezone = Column(String(64))
     notes = relationship("Note", back_populates="user", cascade="all, delete-orphan")
 
     def __repr__(self):
@@ -23,21 +51,112 @@ class User(Base):
 
 class Note(Base):
     __tablename__ = 'notes'
+    __table_args__ = (
+        # Постраничный просмотр заметок пользователя по ключу (created_at, note_id)
+        Index('ix_notes_user_id_created_at', 'user_id', 'created_at', 'note_id'),
+    )
 
     note_id = Column(Integer, primary_key=True)
     title = Column(String(255), nullable=False)
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(UTCDateTime, default=utcnow)
     user_id = Column(BigInteger, ForeignKey('users.user_id'))
     user = relationship("User", back_populates="notes")
+    reminders = relationship("Reminder", back_populates="note", cascade="all, delete-orphan", passive_deletes=True)
 
     def __repr__(self):
         return f"<Note(note_id={self.note_id}, title={self.title}, user_id={self.user_id})>"
 
-engine = create_engine(DATABASE_URL, echo=True)
+class Reminder(Base):
+    __tablename__ = 'reminders'
+    __table_args__ = (
+        # Ключ (remind_at, reminder_id) используется планировщиком для постраничной подгрузки
+        Index('ix_reminders_remind_at', 'remind_at', 'reminder_id'),
+    )
+
+    reminder_id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, ForeignKey('users.user_id'), nullable=False)
+    note_id = Column(Integer, ForeignKey('notes.note_id', ondelete='CASCADE'), nullable=False)
+    remind_at = Column(UTCDateTime, nullable=False)
+    # cron-выражение повторения (см. recurrence.py); NULL — разовое напоминание
+    rule = Column(String(100))
+    note = relationship("Note", back_populates="reminders")
+
+    def __repr__(self):
+        return f"<Reminder(reminder_id={self.reminder_id}, note_id={self.note_id}, remind_at={self.remind_at})>"
+
+class ArchivedNote(Base):
+    """Заметка, дата которой прошла больше ARCHIVE_AFTER_DAYS назад (см. archive.py).
+
+    Перенос сюда держит таблицу notes и ее индексы размером с актуальные заметки.
+    note_id сохраняется прежним, поэтому строки не порождают новых идентификаторов.
+    """
+    __tablename__ = 'notes_archive'
+    __table_args__ = (
+        # Просмотр архива пользователя от новых к старым по ключу (created_at, note_id)
+        Index('ix_notes_archive_user_id_created_at', 'user_id', 'created_at', 'note_id'),
+    )
+
+    note_id = Column(Integer, primary_key=True, autoincrement=False)
+    title = Column(String(255), nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(UTCDateTime, nullable=False)
+    user_id = Column(BigInteger, ForeignKey('users.user_id'), nullable=False)
+    archived_at = Column(UTCDateTime, nullable=False, default=utcnow)
+
+    def __repr__(self):
+        return f"<ArchivedNote(note_id={self.note_id}, title={self.title}, user_id={self.user_id})>"
 
-Session = sessionmaker(bind=engine)
+class ConversationState(Base):
+    __tablename__ = 'conversation_states'
+
+    user_id = Column(BigInteger, primary_key=True)
+    state = Column(String(64), nullable=False)
+    # Сериализованный в JSON словарь скалярных значений шага диалога
+    data = Column(Text, nullable=False, default='{}')
+    expires_at = Column(UTCDateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<ConversationState(user_id={self.user_id}, state={self.state})>"
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """Синхронный движок DATABASE_URL, создается при первом обращении.
+
+    В асинхронном режиме и в роутере webhook он так и не понадобится, поэтому
+    драйвер и пул не загружаются на старте.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = make_engine(DATABASE_URL)
+    return _engine
+
+def dispose_engine():
+    """Закрывает соединения пула, если движок уже создан (например, перед fork)."""
+    if _engine is not None:
+        _engine.dispose()
+
+class LazySessionmaker(sessionmaker):
+    """sessionmaker, привязывающийся к get_engine() при первой сессии."""
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
+
+Session = LazySessionmaker()
 
 def create_tables():
-    """Создает таблицы в базе данных, если их нет."""
-    Base.metadata.create_all(engine)
+    """Создает таблицы напрямую, минуя миграции: для бенчмарков и одноразовых БД.
+
+    Рабочую схему ведет Alembic: alembic upgrade head.
+    """
+    # search регистрирует DDL поисковых индексов (в SQLite — notes_fts), создаваемых вместе с notes;
+    # импорт здесь, потому что search сам импортирует database
+    import search  # noqa: F401
+
+    Base.metadata.create_all(get_engine())
@@ -0,0 +1,182 @@
+"""Единая точка создания движков SQLAlchemy.
+
+Все параметры пула берутся из переменных окружения, поэтому bot.py,
+database.py, aio.py и миграции работают с одинаково настроенными движками.
+Пул замеряет время ожидания свободного соединения: по нему видно, хватает ли
+DB_POOL_SIZE + DB_MAX_OVERFLOW на пиковую конкурентность.
+"""
+import bisect
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+load_dotenv()
+
+
+def _flag(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Сколько секунд ждать свободного соединения, прежде чем выбросить TimeoutError
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Соединения старше этого возраста (секунды) переоткрываются: защита от обрыва по idle-таймауту на стороне сервера
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = _flag("DB_POOL_PRE_PING", "1")
+# Ограничение на время одного запроса в миллисекундах (только PostgreSQL), 0 — без ограничения
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "0"))
+DB_ECHO = _flag("DB_ECHO", "0")
+# Соединения идут через PgBouncer в режиме transaction: пулом управляет он,
+# а серверные prepared statements и параметры сессии использовать нельзя
+DB_PGBOUNCER = _flag("DB_PGBOUNCER", "0")
+
+# Границы гистограммы ожидания соединения, миллисекунды
+WAIT_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolMetrics:
+    """Счетчики выдачи соединений из пула: число выдач, таймауты и время ожидания."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def observe(self, seconds, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.buckets[bisect.bisect_left(WAIT_BUCKETS, seconds * 1000)] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+                "wait_buckets_ms": dict(zip([*map(str, WAIT_BUCKETS), "+Inf"], self.buckets)),
+            }
+
+
+class _TimedPoolMixin:
+    metrics = None
+
+    def _do_get(self):
+        started = time.monotonic()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.observe(time.monotonic() - started, timed_out=True)
+            raise
+        self.metrics.observe(time.monotonic() - started)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() пересоздает пул; счетчики должны пережить это
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def engine_options(database_url, asynchronous=False, statement_timeout=DB_STATEMENT_TIMEOUT, **overrides):
+    """Параметры create_engine для DATABASE_URL; overrides имеют приоритет."""
+    url = make_url(database_url)
+    options = {"echo": DB_ECHO}
+    connect_args = {}
+    poolclass = overrides.get("poolclass")
+
+    if _is_memory_sqlite(url) or (poolclass is not None and not issubclass(poolclass, QueuePool)):
+        # У SQLite в памяти свой пул на одно соединение, размеры пула к нему неприменимы
+        pass
+    elif DB_PGBOUNCER or (asynchronous and url.get_backend_name() == "sqlite"):
+        # aiosqlite держит на каждое соединение свой поток; в пуле они не дали бы процессу завершиться,
+        # поэтому, как и по умолчанию в SQLAlchemy, файловая SQLite в асинхронном режиме работает без пула
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            poolclass=TimedAsyncQueuePool if asynchronous else TimedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+
+    if url.get_backend_name() == "postgresql":
+        driver = url.get_driver_name()
+        if DB_PGBOUNCER and driver == "asyncpg":
+            # В режиме transaction подготовленный запрос может попасть на чужое серверное соединение
+            connect_args.update(statement_cache_size=0, prepared_statement_cache_size=0)
+        if statement_timeout and not DB_PGBOUNCER:
+            # PgBouncer не пропускает параметры запуска; за ним таймаут задается на роль в БД
+            if driver == "asyncpg":
+                connect_args["server_settings"] = {"statement_timeout": str(statement_timeout)}
+            else:
+                connect_args["options"] = f"-c statement_timeout={statement_timeout}"
+
+    if connect_args:
+        options["connect_args"] = connect_args
+    options.update(overrides)
+    return options
+
+
+def _attach_metrics(engine):
+    pool = engine.sync_engine.pool if hasattr(engine, "sync_engine") else engine.pool
+    if isinstance(pool, _TimedPoolMixin):
+        pool.metrics = PoolMetrics()
+    return engine
+
+
+def make_engine(database_url, **overrides):
+    return _attach_metrics(create_engine(database_url, **engine_options(database_url, **overrides)))
+
+
+def make_async_engine(database_url, **overrides):
+    # Импорт здесь: синхронным режимам asyncio-часть SQLAlchemy не нужна
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    return _attach_metrics(
+        create_async_engine(database_url, **engine_options(database_url, asynchronous=True, **overrides))
+    )
+
+
+def pool_stats(engine):
+    """Состояние пула и метрики ожидания; для пулов без замеров (NullPool, StaticPool) — пустой словарь."""
+    engine = getattr(engine, "sync_engine", engine)
+    pool = engine.pool
+    if getattr(pool, "metrics", None) is None:
+        return {}
+    return {
+        "status": pool.status(),
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        **pool.metrics.snapshot(),
+    }
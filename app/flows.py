@@ -0,0 +1,158 @@
+from datetime import datetime
+
+from recurrence import PRESETS, parse_rule
+
+DATE_FORMAT = "%d.%m.%Y %H:%M"
+# Сколько заметок можно указать за раз списком или диапазоном
+MAX_NOTE_IDS = 1000
+
+NEVER_FIRES_TEXT = (
+    "Правило ни разу не срабатывает (например, 30 февраля). Введите другое правило: "
+    "once, daily, weekly, monthly или cron-выражение."
+)
+
+
+class InvalidInput(ValueError):
+    """Ввод не прошел проверку шага; message отправляется пользователю, состояние не меняется."""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def parse_date(text):
+    try:
+        return datetime.strptime(text, DATE_FORMAT)
+    except ValueError:
+        raise InvalidInput("Неверный формат даты. Введите в формате ДД.ММ.ГГГГ ЧЧ:ММ.")
+
+
+def parse_note_id(text):
+    try:
+        return int(text)
+    except ValueError:
+        raise InvalidInput("ID должен быть числом. Попробуйте снова.")
+
+
+def parse_note_ids(text):
+    """Список ID из строки вида «12, 15, 20-40»: без повторов, по возрастанию."""
+    message = f"Введите ID заметки или список через запятую с диапазонами, например 12,15,20-40 (до {MAX_NOTE_IDS})."
+    ids = set()
+    for part in text.replace(" ", "").split(","):
+        if not part:
+            continue
+        first, dash, last = part.partition("-")
+        try:
+            first = int(first)
+            last = int(last) if dash else first
+        except ValueError:
+            raise InvalidInput(message)
+        if first < 1 or last < first or last - first >= MAX_NOTE_IDS:
+            raise InvalidInput(message)
+        ids.update(range(first, last + 1))
+        if len(ids) > MAX_NOTE_IDS:
+            raise InvalidInput(message)
+    if not ids:
+        raise InvalidInput(message)
+    return sorted(ids)
+
+
+def parse_repeat(text):
+    """None для разового напоминания, daily/weekly/monthly или нормализованное cron-выражение.
+
+    Выражение, которое ни разу не срабатывает (например, 0 0 30 2 *), отклоняется здесь же.
+    """
+    value = " ".join(text.lower().split())
+    if value in ("once", "no", "нет"):
+        return None
+    if value in PRESETS:
+        return value
+    try:
+        rule = parse_rule(value)
+    except ValueError:
+        raise InvalidInput(
+            "Не удалось разобрать правило. Введите once, daily, weekly, monthly "
+            "или cron-выражение из пяти полей: минута час день месяц день_недели."
+        )
+    if rule.next_after(datetime.now()) is None:
+        raise InvalidInput(NEVER_FIRES_TEXT)
+    return rule.expression
+
+
+def choice(*options):
+    """Парсер, принимающий одно из options без учета регистра."""
+    message = f"Некорректный выбор. Введите одно из: {', '.join(options)}."
+
+    def parse(text):
+        value = text.lower()
+        if value not in options:
+            raise InvalidInput(message)
+        return value
+
+    parse.__name__ = f"choice{options}"
+    return parse
+
+
+class Step:
+    __slots__ = ("state", "kind", "handler", "parse")
+
+    def __init__(self, state, kind, handler, parse=None):
+        self.state = state
+        self.kind = kind
+        self.handler = handler
+        self.parse = parse
+
+    def __repr__(self):
+        return f"Step({self.state!r}, {self.kind!r}, {getattr(self.handler, '__name__', self.handler)})"
+
+
+class ConversationFlow:
+    """Таблица переходов диалога: шаг по (состоянию, виду ввода) и действие по тексту кнопки за O(1).
+
+    Вид ввода — text или document. Обработчик шага вызывается как
+    handler(update, user_id, value, data), где value — результат parse(value)
+    (или сам текст либо документ), data — данные состояния. Если parse бросает
+    InvalidInput, пользователю уходит ее сообщение, а состояние остается прежним.
+    Вне диалога текст ищется среди кнопок: handler(update, context), иначе fallback.
+    """
+
+    def __init__(self, fallback):
+        self.steps = {}
+        self.buttons = {}
+        self.fallback = fallback
+
+    def step(self, state, handler, parse=None, kind="text"):
+        if (state, kind) in self.steps:
+            raise ValueError(f"Шаг {state} ({kind}) уже зарегистрирован")
+        self.steps[(state, kind)] = Step(state, kind, handler, parse)
+        return self
+
+    def button(self, text, handler):
+        if text in self.buttons:
+            raise ValueError(f"Кнопка {text} уже зарегистрирована")
+        self.buttons[text] = handler
+        return self
+
+    def handle(self, update, context, current, value, kind="text"):
+        """current — (state, data) из хранилища состояний или None."""
+        if current:
+            state, data = current
+            step = self.steps.get((state, kind))
+            if step is not None:
+                if step.parse is not None:
+                    try:
+                        value = step.parse(value)
+                    except InvalidInput as e:
+                        update.message.reply_text(e.message)
+                        return
+                step.handler(update, update.message.from_user.id, value, data)
+                return
+        handler = self.buttons.get(value) if kind == "text" else None
+        (handler or self.fallback)(update, context)
+
+    def describe(self):
+        """Словарь {(состояние, вид ввода): (обработчик, парсер)} для тестов и документации."""
+        return {
+            key: (step.handler.__name__, step.parse.__name__ if step.parse else None)
+            for key, step in self.steps.items()
+        }
@@ -0,0 +1,106 @@
+"""Ограничение входящих обновлений до того, как они дойдут до обработчиков.
+
+Каждому пользователю выдается token bucket: rate обновлений в секунду с запасом
+burst. Кроме того, одновременно выполняется не больше concurrency обработчиков
+(все они ходят в БД). Лишнее обновление отбрасывается сразу, без ожидания: поток
+диспетчера (или цикл событий в асинхронном режиме) не занимается, а пользователь
+получает короткий ответ — не чаще раза в notice_interval секунд.
+"""
+import threading
+from time import monotonic
+
+from cachetools import LRUCache
+
+from ratelimit import TokenBucket
+
+USER_RATE = 2
+USER_BURST = 10
+CONCURRENCY = 64
+NOTICE_INTERVAL = 10
+
+RATE_LIMITED_TEXT = "Слишком много сообщений. Подождите несколько секунд и повторите."
+BUSY_TEXT = "Бот сейчас перегружен. Повторите через несколько секунд."
+
+
+class IngressLimiter:
+    """Пропускает обновление к обработчику или отклоняет его с причиной rate или busy.
+
+    Память ограничена max_users: вытесненное из LRU ведро создается заново полным.
+    on_reject(reason) вызывается при каждом отклонении, например для счетчика метрик.
+    """
+
+    def __init__(self, rate=USER_RATE, burst=USER_BURST, concurrency=CONCURRENCY, max_users=100000,
+                 notice_interval=NOTICE_INTERVAL, on_reject=None):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.notice_interval = notice_interval
+        self.on_reject = on_reject
+        # user_id -> [TokenBucket, время последнего ответа об отказе]
+        self._users = LRUCache(maxsize=max_users)
+        self._lock = threading.Lock()
+        self._active = 0
+
+    def guard(self, callback):
+        """Оборачивает обработчик PTB (update, context) проверкой лимитов."""
+        def wrapper(update, context):
+            user = update.effective_user
+            if self.rate and user is not None and not self._take(user.id):
+                return self._reject(update, user.id, "rate", RATE_LIMITED_TEXT)
+            if not self._enter():
+                return self._reject(update, user.id if user else None, "busy", BUSY_TEXT)
+            try:
+                return callback(update, context)
+            finally:
+                with self._lock:
+                    self._active -= 1
+
+        wrapper.__name__ = getattr(callback, "__name__", "handler")
+        wrapper.__wrapped__ = callback
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            return {"active": self._active, "users": len(self._users)}
+
+    def _take(self, user_id):
+        now = monotonic()
+        with self._lock:
+            return self._entry(user_id)[0].consume(now) == 0
+
+    def _enter(self):
+        # Без ожидания свободного места: очередь из заблокированных потоков и есть то, от чего защищаемся
+        with self._lock:
+            if self.concurrency and self._active >= self.concurrency:
+                return False
+            self._active += 1
+            return True
+
+    def _reject(self, update, user_id, reason, text):
+        if self.on_reject:
+            self.on_reject(reason)
+        if user_id is None or not self._should_notice(user_id):
+            if update.callback_query:
+                update.callback_query.answer()
+            return None
+        if update.callback_query:
+            update.callback_query.answer(text)
+        elif update.effective_message:
+            update.effective_message.reply_text(text)
+        return None
+
+    def _should_notice(self, user_id):
+        now = monotonic()
+        with self._lock:
+            entry = self._entry(user_id)
+            if entry[1] is not None and now - entry[1] < self.notice_interval:
+                return False
+            entry[1] = now
+            return True
+
+    def _entry(self, user_id):
+        entry = self._users.get(user_id)
+        if entry is None:
+            bucket = TokenBucket(self.rate, self.burst) if self.rate else None
+            entry = self._users[user_id] = [bucket, None]
+        return entry
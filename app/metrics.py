@@ -0,0 +1,350 @@
+"""Метрики NoteBot в формате Prometheus и выборочный профилировщик.
+
+Metrics оборачивает обработчики и фоновые задачи: для каждого вызова
+записываются длительность, число и суммарное время SQL-запросов (через события
+SQLAlchemy, привязанные к текущему вызову через contextvar), а для каждого
+запроса к Bot API — его длительность. Глубины очередей снимаются в момент
+отдачи /metrics. SamplingProfiler раз в interval снимает стеки всех потоков и
+копит их в формате folded stacks (flamegraph.pl, speedscope).
+"""
+import bisect
+import contextvars
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from telegram.utils.request import Request
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# [число запросов, секунды в БД, имя] текущего обработчика или задачи; None — вне их
+_current = contextvars.ContextVar("metrics_current", default=None)
+_db_metrics = None
+_request_metrics = None
+
+
+def _labels(pairs):
+    pairs = [(key, value) for key, value in pairs if value is not None]
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help, label, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        # значение метки -> [счетчики по корзинам..., +Inf, сумма]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self, lines, const):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} histogram")
+        with self._lock:
+            series = {label: list(values) for label, values in self._series.items()}
+        for label, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], values):
+                cumulative += count
+                labels = _labels([*const, (self.label, label), ("le", bound)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels([*const, (self.label, label)])
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{labels} {values[-1]}")
+
+
+class Counter:
+    def __init__(self, name, help, label):
+        self.name = name
+        self.help = help
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label, amount=1):
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def render(self, lines, const):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} counter")
+        with self._lock:
+            values = dict(self._values)
+        for label, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels([*const, (self.label, label)])} {value}")
+
+
+class Metrics:
+    """Реестр метрик одного процесса бота."""
+
+    def __init__(self):
+        self.handler_seconds = Histogram(
+            "notebot_handler_seconds", "Время обработки обновления обработчиком", "handler")
+        self.handler_db_queries = Histogram(
+            "notebot_handler_db_queries", "SQL-запросов за один вызов обработчика", "handler", QUERY_COUNT_BUCKETS)
+        self.handler_db_seconds = Histogram(
+            "notebot_handler_db_seconds", "Время SQL-запросов за один вызов обработчика", "handler")
+        self.handler_errors = Counter(
+            "notebot_handler_errors_total", "Исключения в обработчиках и фоновых задачах", "handler")
+        self.ingress_rejected = Counter(
+            "notebot_ingress_rejected_total", "Обновления, отклоненные до обработчика (rate, busy)", "reason")
+        self.job_seconds = Histogram(
+            "notebot_job_seconds", "Время выполнения фоновой задачи", "job")
+        self.db_query_seconds = Histogram(
+            "notebot_db_query_seconds", "Время одного SQL-запроса", "source")
+        self.telegram_seconds = Histogram(
+            "notebot_telegram_request_seconds", "Время запроса к Bot API", "method")
+        self.telegram_errors = Counter(
+            "notebot_telegram_errors_total", "Запросы к Bot API, завершившиеся ошибкой", "method")
+        self.write_batch_rows = Histogram(
+            "notebot_write_batch_rows", "Записей заметок в одной транзакции write-behind", "outcome", BATCH_BUCKETS)
+        self.write_flush_seconds = Histogram(
+            "notebot_write_flush_seconds", "Время транзакции пакета write-behind", "outcome")
+        self.write_wait_seconds = Histogram(
+            "notebot_write_wait_seconds", "Время от постановки записи заметки в очередь до коммита", "outcome")
+        self._collectors = [
+            self.handler_seconds, self.handler_db_queries, self.handler_db_seconds, self.handler_errors,
+            self.ingress_rejected, self.job_seconds, self.db_query_seconds, self.telegram_seconds, self.telegram_errors,
+            self.write_batch_rows, self.write_flush_seconds, self.write_wait_seconds,
+        ]
+        # (имя, описание, функция без аргументов, возвращающая число, тип метрики)
+        self._gauges = []
+
+    def gauge(self, name, help, callback, kind="gauge"):
+        """Регистрирует метрику, значение которой вычисляется при каждой отдаче /metrics.
+
+        kind="counter" — для монотонных счетчиков, которые ведет сам компонент (имя с суффиксом _total).
+        """
+        self._gauges.append((name, help, callback, kind))
+
+    def timed_handler(self, callback, name=None):
+        return self._timed(callback, name or callback.__name__, self.handler_seconds, per_update=True)
+
+    def timed_job(self, callback, name=None):
+        return self._timed(callback, name or callback.__name__, self.job_seconds, per_update=False)
+
+    def _timed(self, callback, name, histogram, per_update):
+        def wrapper(*args, **kwargs):
+            record = [0, 0.0, name]
+            token = _current.set(record)
+            started = time.perf_counter()
+            try:
+                return callback(*args, **kwargs)
+            except Exception:
+                self.handler_errors.inc(name)
+                raise
+            finally:
+                histogram.observe(name, time.perf_counter() - started)
+                _current.reset(token)
+                if per_update:
+                    self.handler_db_queries.observe(name, record[0])
+                    self.handler_db_seconds.observe(name, record[1])
+
+        wrapper.__name__ = name
+        wrapper.__wrapped__ = callback
+        return wrapper
+
+    def install_request_hooks(self):
+        """Направляет в этот реестр замеры всех TimedRequest процесса."""
+        global _request_metrics
+        _request_metrics = self
+
+    def install_db_hooks(self):
+        """Подключает к SQLAlchemy подсчет запросов; действует на все движки процесса."""
+        global _db_metrics
+        if _db_metrics is None:
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _db_metrics = self
+
+    def render(self, labels=None):
+        const = sorted((labels or {}).items())
+        lines = []
+        for collector in self._collectors:
+            collector.render(lines, const)
+        for name, help, callback, kind in self._gauges:
+            try:
+                value = callback()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{_labels(const)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None or _db_metrics is None:
+        return
+    elapsed = time.perf_counter() - started
+    record = _current.get()
+    if record is not None:
+        record[0] += 1
+        record[1] += elapsed
+    _db_metrics.db_query_seconds.observe(record[2] if record is not None else "background", elapsed)
+
+
+class TimedRequestMixin:
+    """Замеряет запросы к Bot API; ставится в базовые классы перед telegram.utils.request.Request."""
+
+    def post(self, url, *args, **kwargs):
+        return _timed_request(super().post, url, *args, **kwargs)
+
+    def retrieve(self, url, *args, **kwargs):
+        return _timed_request(super().retrieve, url, *args, **kwargs)
+
+
+class TimedRequest(TimedRequestMixin, Request):
+    pass
+
+
+def _timed_request(call, url, *args, **kwargs):
+    metrics = _request_metrics
+    if metrics is None:
+        return call(url, *args, **kwargs)
+    method = "getFile" if "/file/bot" in url else url.rsplit("/", 1)[-1]
+    started = time.perf_counter()
+    try:
+        return call(url, *args, **kwargs)
+    except Exception:
+        metrics.telegram_errors.inc(method)
+        raise
+    finally:
+        metrics.telegram_seconds.observe(method, time.perf_counter() - started)
+
+
+def merge_expositions(texts):
+    """Склеивает выводы render() нескольких процессов так, чтобы каждое семейство метрик шло одним блоком."""
+    families = {}
+    current = None
+    for text in texts:
+        for line in text.splitlines():
+            if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                current = line.split(" ", 3)[2]
+                family = families.setdefault(current, {"HELP": None, "TYPE": None, "samples": []})
+                family[line[2:6]] = family[line[2:6]] or line
+            elif line and current is not None:
+                families[current]["samples"].append(line)
+    lines = []
+    for family in families.values():
+        lines += [line for line in (family["HELP"], family["TYPE"]) if line]
+        lines += family["samples"]
+    return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Раз в interval секунд снимает стеки всех потоков; накопленное отдается в формате folded stacks."""
+
+    def __init__(self, interval=0.01, max_stacks=10000, max_depth=64):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self.samples = 0
+        self._stacks = StackCounter()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def folded(self, reset=False):
+        with self._lock:
+            stacks = self._stacks
+            if reset:
+                self._stacks = StackCounter()
+                self.samples = 0
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stopped.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            frames = sys._current_frames()
+            with self._lock:
+                self.samples += 1
+                for ident, frame in frames.items():
+                    if ident == own:
+                        continue
+                    stack = self._stack(frame, names.get(ident, str(ident)))
+                    if stack in self._stacks or len(self._stacks) < self.max_stacks:
+                        self._stacks[stack] += 1
+
+    def _stack(self, frame, thread_name):
+        parts = []
+        while frame is not None and len(parts) < self.max_depth:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+            frame = frame.f_back
+        parts.append(thread_name)
+        return ";".join(reversed(parts))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    metrics = None
+    profiler = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            self._reply(200, self.metrics(), PROMETHEUS_CONTENT_TYPE)
+        elif url.path == "/profile" and self.profiler is not None:
+            reset = parse_qs(url.query).get("reset") == ["1"]
+            self._reply(200, self.profiler(reset), "text/plain; charset=utf-8")
+        else:
+            self._reply(404, "not found\n", "text/plain; charset=utf-8")
+
+    def _reply(self, status, text, content_type):
+        body = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(render, port, profile=None, host="0.0.0.0"):
+    """HTTP-сервер /metrics (и /profile, если передан profile(reset)) в фоновом потоке."""
+    handler = type("Handler", (_Handler,), {
+        "metrics": staticmethod(render),
+        "profiler": staticmethod(profile) if profile else None,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,219 @@
+import heapq
+import itertools
+import logging
+import threading
+from time import monotonic
+
+from cachetools import LRUCache
+from telegram.error import BadRequest, ChatMigrated, NetworkError, RetryAfter, TelegramError, TimedOut, Unauthorized
+
+from ratelimit import TokenBucket
+from timezones import utcnow
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: около 30 сообщений в секунду на бота и одно в секунду на чат
+GLOBAL_RATE = 30
+CHAT_RATE = 1
+
+
+class OutboundMessage:
+    __slots__ = ("chat_id", "text", "kwargs", "due", "on_sent", "on_failed", "attempts")
+
+    def __init__(self, chat_id, text, kwargs, due, on_sent, on_failed):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.due = due
+        self.on_sent = on_sent
+        self.on_failed = on_failed
+        self.attempts = 0
+
+
+class OutboundQueue:
+    """Очередь исходящих сообщений с ограничением скорости.
+
+    Сообщения уходят в порядке времени due, с учетом глобального и поштучного
+    для каждого чата token bucket. RetryAfter приостанавливает всю отправку на
+    указанное Telegram время, сетевые ошибки повторяются с экспоненциальной паузой.
+    """
+
+    def __init__(self, bot, workers=4, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE,
+                 max_attempts=5, max_backoff=60, max_chats=100000):
+        self.bot = bot
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+
+        self._global_bucket = TokenBucket(global_rate)
+        self._chat_rate = chat_rate
+        # Вытесненное ведро просто создается заново полным, поэтому память ограничена
+        self._chat_buckets = LRUCache(maxsize=max_chats)
+
+        # Готовые к отправке: (due, seq, message); отложенные: (not_before, seq, message)
+        self._ready = []
+        self._delayed = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+        self._in_flight = 0
+
+        self._sent = 0
+        self._failed = 0
+        self._retried = 0
+        self._throttled = 0
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+        self._total_lag = 0.0
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"outbound-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Останавливает воркеры, предварительно отправив все, что уже в очереди."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def send(self, chat_id, text, due=None, on_sent=None, on_failed=None, **kwargs):
+        """Ставит сообщение в очередь; due (aware datetime) задает приоритет и отсчет задержки."""
+        message = OutboundMessage(chat_id, text, kwargs, due or utcnow(), on_sent, on_failed)
+        with self._cond:
+            heapq.heappush(self._ready, (message.due, next(self._seq), message))
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queue_depth": len(self._ready),
+                "delayed": len(self._delayed),
+                "in_flight": self._in_flight,
+                "sent": self._sent,
+                "failed": self._failed,
+                "retried": self._retried,
+                "throttled": self._throttled,
+                "last_lag_seconds": self._last_lag,
+                "max_lag_seconds": self._max_lag,
+                "avg_lag_seconds": self._total_lag / self._sent if self._sent else 0.0,
+            }
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self._chat_rate)
+        return bucket
+
+    def _next(self):
+        """Ждет сообщение, для которого есть токены в обоих ведрах. None — пора завершаться."""
+        with self._cond:
+            while True:
+                now = monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, seq, message = heapq.heappop(self._delayed)
+                    heapq.heappush(self._ready, (message.due, seq, message))
+
+                if not self._ready:
+                    if not self._running and not self._delayed:
+                        return None
+                    timeout = self._delayed[0][0] - now if self._delayed else None
+                    self._cond.wait(timeout)
+                    continue
+
+                wait = self._global_bucket.delay(now)
+                if wait:
+                    self._cond.wait(wait)
+                    continue
+
+                _, seq, message = heapq.heappop(self._ready)
+                wait = self._chat_bucket(message.chat_id).consume(now)
+                if wait:
+                    heapq.heappush(self._delayed, (now + wait, seq, message))
+                    continue
+
+                self._global_bucket.consume(now)
+                self._in_flight += 1
+                return message
+
+    def _retry(self, message, delay):
+        with self._cond:
+            self._retried += 1
+            heapq.heappush(self._delayed, (monotonic() + delay, next(self._seq), message))
+            self._cond.notify()
+
+    def _worker(self):
+        while True:
+            message = self._next()
+            if message is None:
+                return
+            try:
+                self._deliver(message)
+            except Exception:
+                # Воркер не должен умирать: иначе очередь молча встанет, когда погибнут все
+                logger.exception("Ошибка при отправке сообщения в чат %s", message.chat_id)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+
+    def _deliver(self, message):
+        message.attempts += 1
+        try:
+            self.bot.send_message(chat_id=message.chat_id, text=message.text, **message.kwargs)
+        except RetryAfter as e:
+            # Флуд-контроль Telegram действует на весь бот: притормаживаем всю отправку
+            with self._cond:
+                self._throttled += 1
+                self._global_bucket.pause(e.retry_after)
+            self._retry(message, e.retry_after)
+            return
+        except ChatMigrated as e:
+            message.chat_id = e.new_chat_id
+            self._retry(message, 0)
+            return
+        except (Unauthorized, BadRequest) as e:
+            # Пользователь заблокировал бота или чат не существует: повтор не поможет
+            self._fail(message, e)
+            return
+        except (TimedOut, NetworkError, TelegramError) as e:
+            # Сетевые сбои и прочие ошибки Bot API («Invalid server response», Conflict) повторяем ограниченно
+            if message.attempts >= self.max_attempts:
+                self._fail(message, e)
+            else:
+                self._retry(message, min(2 ** message.attempts, self.max_backoff))
+            return
+        except Exception as e:
+            logger.exception("Неожиданная ошибка отправки в чат %s", message.chat_id)
+            self._fail(message, e)
+            return
+
+        lag = max((utcnow() - message.due).total_seconds(), 0.0)
+        with self._cond:
+            self._sent += 1
+            self._last_lag = lag
+            self._max_lag = max(self._max_lag, lag)
+            self._total_lag += lag
+        if message.on_sent:
+            self._callback(message.on_sent)
+
+    def _fail(self, message, error):
+        with self._cond:
+            self._failed += 1
+        logger.warning("Не удалось отправить сообщение в чат %s: %s", message.chat_id, error)
+        if message.on_failed:
+            self._callback(message.on_failed, error)
+
+    def _callback(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception:
+            logger.exception("Ошибка в обработчике результата отправки")
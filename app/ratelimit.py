@@ -0,0 +1,44 @@
+from time import monotonic
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не больше capacity в запасе.
+
+    Не потокобезопасен, синхронизация остается на вызывающем.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        # Меньше одного токена ведро не накопило бы никогда: при rate < 1 (лимит в минуту) отправка встала бы навсегда
+        self.capacity = max(capacity or rate, 1)
+        self.tokens = self.capacity
+        self.updated = monotonic()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now=None):
+        """Сколько секунд ждать до появления токена (0, если токен есть)."""
+        now = monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return max(self.updated - now, 0) + (1 - self.tokens) / self.rate
+
+    def consume(self, now=None):
+        """Забирает токен; возвращает 0 при успехе или время ожидания, не забирая токен."""
+        now = monotonic() if now is None else now
+        wait = self.delay(now)
+        if wait == 0:
+            self.tokens -= 1
+        return wait
+
+    def pause(self, seconds, now=None):
+        """Опустошает ведро и запрещает выдачу токенов на seconds секунд."""
+        now = monotonic() if now is None else now
+        self.tokens = 0
+        self.updated = max(self.updated, now + seconds)
@@ -0,0 +1,124 @@
+"""Правила повторения напоминаний.
+
+Правило хранится в reminders.rule как cron-выражение из пяти полей
+(минута, час, день месяца, месяц, день недели). daily, weekly и monthly
+переводятся в cron по времени первого срабатывания. Выражение задается в
+местном времени пользователя. В БД лежит только ближайшее время срабатывания
+в UTC; следующее вычисляется next_occurrence после отправки, перебором по полям
+(месяц, день, час, минута) без перебора минут.
+"""
+from datetime import timedelta, timezone
+from functools import lru_cache
+
+PRESETS = ("daily", "weekly", "monthly")
+# Правило, которое ни разу не срабатывает за этот срок, считается исчерпанным (например, 30 февраля)
+SEARCH_YEARS = 5
+
+_FIELDS = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 7),
+)
+
+
+def preset_rule(preset, first):
+    """cron-выражение для daily/weekly/monthly с временем и днем из first."""
+    if preset == "daily":
+        return f"{first.minute} {first.hour} * * *"
+    if preset == "weekly":
+        return f"{first.minute} {first.hour} * * {(first.weekday() + 1) % 7}"
+    if preset == "monthly":
+        return f"{first.minute} {first.hour} {first.day} * *"
+    raise ValueError(f"Неизвестное правило повторения: {preset}")
+
+
+def _parse_field(value, low, high):
+    values = set()
+    for part in value.split(","):
+        rng, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if step < 1:
+            raise ValueError(part)
+        if rng == "*":
+            start, end = low, high
+        elif "-" in rng:
+            start, end = (int(v) for v in rng.split("-", 1))
+        else:
+            start = int(rng)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(part)
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronRule:
+    __slots__ = ("expression", "minutes", "hours", "days", "months", "weekdays", "any_day", "any_weekday")
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != len(_FIELDS):
+            raise ValueError(expression)
+        self.expression = " ".join(fields)
+        minutes, hours, days, months, weekdays = (
+            frozenset(_parse_field(value, low, high)) for value, (_, low, high) in zip(fields, _FIELDS)
+        )
+        self.minutes = sorted(minutes)
+        self.hours = sorted(hours)
+        self.days = days
+        self.months = months
+        # В cron воскресенье — и 0, и 7
+        self.weekdays = frozenset(day % 7 for day in weekdays)
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        # Как в cron: если заданы оба поля, достаточно совпадения любого
+        return day or weekday
+
+    def next_after(self, moment):
+        """Первое время срабатывания строго после moment или None, если его нет в ближайшие годы."""
+        t = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t.replace(year=t.year + SEARCH_YEARS, day=min(t.day, 28))
+        while t < limit:
+            if t.month not in self.months:
+                year, month = (t.year + 1, 1) if t.month == 12 else (t.year, t.month + 1)
+                t = t.replace(year=year, month=month, day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            hour = next((h for h in self.hours if h >= t.hour), None)
+            if hour is None:
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if hour != t.hour:
+                t = t.replace(hour=hour, minute=0)
+            minute = next((m for m in self.minutes if m >= t.minute), None)
+            if minute is None:
+                t = t.replace(minute=0) + timedelta(hours=1)
+                continue
+            return t.replace(minute=minute)
+        return None
+
+    def first_at_or_after(self, moment):
+        return self.next_after(moment - timedelta(minutes=1))
+
+
+@lru_cache(maxsize=1024)
+def parse_rule(expression):
+    """CronRule по cron-выражению; ValueError, если оно некорректно."""
+    return CronRule(expression)
+
+
+def next_occurrence(rule, after, zone):
+    """Следующее после after (aware) время срабатывания правила rule в поясе zone, в UTC."""
+    local = parse_rule(rule).next_after(after.astimezone(zone).replace(tzinfo=None))
+    return local and local.replace(tzinfo=zone).astimezone(timezone.utc)
+
@@ -0,0 +1,207 @@
+import heapq
+import threading
+from datetime import timedelta
+
+from sqlalchemy import bindparam, delete, func, select, tuple_, update
+
+from database import Reminder
+from timezones import utcnow
+
+# Идентификатор-заглушка: курсор (t, MAX_ID) означает «загружено всё до момента t включительно»
+MAX_ID = 2 ** 63 - 1
+
+
+class ReminderScheduler:
+    """Планировщик напоминаний, хранящий время срабатывания в таблице reminders.
+
+    В памяти держится только окно ближайших напоминаний (куча по remind_at),
+    остальные подгружаются из БД порциями по индексу (remind_at, reminder_id).
+    Строка удаляется только после отправки, поэтому после перезапуска
+    пропущенные напоминания подхватываются первым же опросом. У повторяющегося
+    напоминания после отправки вместо удаления переносится remind_at, так что
+    правило занимает одну строку и не больше одной записи в куче.
+
+    shard=(index, count) ограничивает планировщик напоминаниями пользователей,
+    для которых abs(user_id) % count == index (см. webhook.py).
+    """
+
+    def __init__(self, session_factory, window=timedelta(minutes=10), batch_size=500, capacity=10000,
+                 shard=None):
+        self.Session = session_factory
+        self.shard = shard
+        self.window = window
+        self.batch_size = batch_size
+        self.capacity = capacity
+
+        self._heap = []
+        # Напоминания в куче или уже выданные на отправку, но еще не удаленные из БД
+        self._queued = set()
+        # Ключ (remind_at, reminder_id), до которого включительно все напоминания загружены
+        self._cursor = None
+        self._polling = False
+        self._armed_while_polling = []
+        # Отправленные напоминания, ожидающие пакетного удаления из БД
+        self._acked = []
+        # Отправленные повторяющиеся напоминания: (reminder_id, следующее время срабатывания)
+        self._advanced = []
+        self._lock = threading.Lock()
+
+    def add(self, session, user_id, note_id, remind_at, rule=None):
+        """Сохраняет напоминание в сессии вызывающего; коммит остается за ним."""
+        return self.add_many(session, user_id, [note_id], remind_at, rule=rule)[0]
+
+    def add_many(self, session, user_id, note_ids, remind_at, rule=None):
+        """Одно и то же напоминание для нескольких заметок одним пакетным INSERT; коммит за вызывающим."""
+        reminders = [Reminder(user_id=user_id, note_id=note_id, remind_at=remind_at, rule=rule) for note_id in note_ids]
+        session.add_all(reminders)
+        session.flush()
+        return reminders
+
+    def arm(self, reminder_id, remind_at):
+        """Ставит закоммиченное напоминание в кучу, если оно попадает в уже загруженное окно.
+
+        Более поздние напоминания подхватит очередной опрос.
+        """
+        with self._lock:
+            if self._polling:
+                self._armed_while_polling.append((remind_at, reminder_id))
+            elif self._cursor is not None and (remind_at, reminder_id) <= self._cursor:
+                self._push(remind_at, reminder_id)
+
+    def poll(self, context=None):
+        """Догружает в кучу напоминания, срабатывающие в пределах окна."""
+        with self._lock:
+            if self._polling:
+                return
+            self._polling = True
+            cursor = self._cursor
+            free = self.capacity - len(self._heap)
+
+        window_end = utcnow() + self.window
+        loaded = []
+        exhausted = False
+        try:
+            with self.Session() as session:
+                while free > 0:
+                    limit = min(self.batch_size, free)
+                    query = select(Reminder.remind_at, Reminder.reminder_id).where(
+                        Reminder.remind_at <= window_end
+                    )
+                    if self.shard is not None:
+                        index, count = self.shard
+                        query = query.where(func.abs(Reminder.user_id) % count == index)
+                    if cursor is not None:
+                        query = query.where(
+                            tuple_(Reminder.remind_at, Reminder.reminder_id) > tuple_(*cursor)
+                        )
+                    query = query.order_by(Reminder.remind_at, Reminder.reminder_id).limit(limit)
+                    rows = session.execute(query).all()
+                    loaded.extend(rows)
+                    free -= len(rows)
+                    if rows:
+                        cursor = tuple(rows[-1])
+                    if len(rows) < limit:
+                        exhausted = True
+                        break
+        finally:
+            with self._lock:
+                if exhausted:
+                    cursor = max(cursor or (window_end, MAX_ID), (window_end, MAX_ID))
+                self._cursor = cursor
+                for remind_at, reminder_id in loaded:
+                    self._push(remind_at, reminder_id)
+                for remind_at, reminder_id in self._armed_while_polling:
+                    if cursor is not None and (remind_at, reminder_id) <= cursor:
+                        self._push(remind_at, reminder_id)
+                self._armed_while_polling = []
+                self._polling = False
+
+    def pop_due(self, now=None, limit=None):
+        """Забирает из кучи сработавшие напоминания как пары (remind_at, reminder_id)."""
+        now = now or utcnow()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and (limit is None or len(due) < limit):
+                due.append(heapq.heappop(self._heap))
+        return due
+
+    def ack(self, reminder_id):
+        """Отмечает напоминание отработавшим; удаление из БД произойдет при flush()."""
+        with self._lock:
+            self._acked.append(reminder_id)
+
+    def advance(self, reminder_id, remind_at):
+        """Отмечает повторяющееся напоминание отправленным; при flush() оно переносится на remind_at."""
+        with self._lock:
+            self._advanced.append((reminder_id, remind_at))
+
+    def retry(self, reminder_id, delay):
+        """Возвращает выданное напоминание в кучу, чтобы повторить отправку через delay секунд."""
+        with self._lock:
+            heapq.heappush(self._heap, (utcnow() + timedelta(seconds=delay), reminder_id))
+
+    def flush(self):
+        """Одним запросом удаляет все подтвержденные напоминания и переносит повторяющиеся.
+
+        Если запрос к БД не удался, пакет возвращается в очередь и уйдет при следующем flush():
+        иначе отправленные напоминания повторились бы после рестарта, а перенесенные не сработали бы вовсе.
+        """
+        with self._lock:
+            acked, self._acked = self._acked, []
+            advanced, self._advanced = self._advanced, []
+        try:
+            self.complete(acked)
+        except Exception:
+            with self._lock:
+                self._acked[:0] = acked
+                self._advanced[:0] = advanced
+            raise
+        try:
+            self.reschedule(advanced)
+        except Exception:
+            with self._lock:
+                self._advanced[:0] = advanced
+            raise
+
+    def complete(self, reminder_ids):
+        """Удаляет отработавшие напоминания из БД."""
+        if not reminder_ids:
+            return
+        with self.Session() as session:
+            session.execute(delete(Reminder).where(Reminder.reminder_id.in_(reminder_ids)))
+            session.commit()
+        with self._lock:
+            self._queued.difference_update(reminder_ids)
+
+    def reschedule(self, advanced):
+        """Переносит повторяющиеся напоминания на следующее срабатывание и снова ставит их в очередь."""
+        if not advanced:
+            return
+        # UPDATE уровня Core одним executemany: в отличие от ORM-обновления по первичному ключу,
+        # он не падает со StaleDataError, если напоминание успели удалить вместе с заметкой
+        table = Reminder.__table__
+        statement = (
+            update(table)
+            .where(table.c.reminder_id == bindparam("b_reminder_id"))
+            .values(remind_at=bindparam("b_remind_at"))
+        )
+        with self.Session() as session:
+            session.execute(
+                statement,
+                [{"b_reminder_id": reminder_id, "b_remind_at": remind_at} for reminder_id, remind_at in advanced],
+            )
+            session.commit()
+        with self._lock:
+            self._queued.difference_update(reminder_id for reminder_id, _ in advanced)
+        for reminder_id, remind_at in advanced:
+            self.arm(reminder_id, remind_at)
+
+    def pending(self):
+        with self._lock:
+            return len(self._heap)
+
+    def _push(self, remind_at, reminder_id):
+        if reminder_id in self._queued:
+            return
+        self._queued.add(reminder_id)
+        heapq.heappush(self._heap, (remind_at, reminder_id))
@@ -0,0 +1,93 @@
+import re
+
+from sqlalchemy import DDL, and_, column, event, func, literal_column, or_, select, table, text
+
+from database import Note
+
+# Один и тот же текст выражения используется в индексе и в запросе, иначе Postgres не применит индекс.
+# Конфигурация simple: заметки на разных языках, стемминг не нужен, частичные слова ищутся по префиксу
+SEARCH_DOCUMENT = "title || ' ' || content"
+SEARCH_VECTOR = f"to_tsvector('simple', {SEARCH_DOCUMENT})"
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_notes_search_tsv ON notes USING gin (({SEARCH_VECTOR}))",
+    f"CREATE INDEX IF NOT EXISTS ix_notes_search_trgm ON notes USING gin (({SEARCH_DOCUMENT}) gin_trgm_ops)",
+]
+
+# Для тестов и локальной разработки: FTS5-таблица с внешним содержимым, синхронизируемая триггерами
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5("
+    "title, content, content='notes', content_rowid='note_id')",
+    "CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN "
+    "INSERT INTO notes_fts(rowid, title, content) VALUES (new.note_id, new.title, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, title, content) VALUES ('delete', old.note_id, old.title, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, title, content) VALUES ('delete', old.note_id, old.title, old.content); "
+    "INSERT INTO notes_fts(rowid, title, content) VALUES (new.note_id, new.title, new.content); END",
+]
+
+for statement in POSTGRES_DDL:
+    event.listen(Note.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in SQLITE_DDL:
+    event.listen(Note.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+notes_fts = table("notes_fts", column("rowid"))
+
+# Слова короче трех символов триграммный индекс не ускоряет
+MIN_TRIGRAM_LENGTH = 3
+
+
+def search_terms(query):
+    """Слова запроса: буквы и цифры, без операторов FTS и подстановочных символов."""
+    return re.findall(r"[^\W_]+", query.lower())[:10]
+
+
+def search_notes(session, user_id, query, limit, offset=0):
+    """Заметки пользователя, подходящие под все слова запроса, лучшие первыми.
+
+    Возвращает limit + 1 строк максимум: лишняя означает, что есть следующая страница.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    dialect = session.get_bind().dialect.name
+    columns = (Note.note_id, Note.title, Note.content, Note.created_at)
+
+    if dialect == "postgresql":
+        vector = literal_column(SEARCH_VECTOR)
+        document = literal_column(f"({SEARCH_DOCUMENT})")
+        ts_query = func.to_tsquery(literal_column("'simple'"), " & ".join(f"{term}:*" for term in terms))
+        # Префиксы слов ищутся по tsvector, подстроки внутри слов — по триграммам
+        matches = [vector.op("@@")(ts_query)]
+        if all(len(term) >= MIN_TRIGRAM_LENGTH for term in terms):
+            matches.append(_all_ilike(document, terms))
+        statement = (
+            select(*columns)
+            .where(Note.user_id == user_id, or_(*matches))
+            .order_by(func.ts_rank_cd(vector, ts_query).desc(), func.word_similarity(query, document).desc(),
+                      Note.created_at.desc())
+        )
+    elif dialect == "sqlite":
+        match = " ".join(f'"{term}"*' for term in terms)
+        statement = (
+            select(*columns)
+            .join_from(notes_fts, Note, Note.note_id == notes_fts.c.rowid)
+            .where(text("notes_fts MATCH :match").bindparams(match=match), Note.user_id == user_id)
+            .order_by(text("bm25(notes_fts)"), Note.created_at.desc())
+        )
+    else:
+        document = Note.title + " " + Note.content
+        statement = (
+            select(*columns)
+            .where(Note.user_id == user_id, _all_ilike(document, terms))
+            .order_by(Note.created_at.desc())
+        )
+
+    return session.execute(statement.limit(limit + 1).offset(offset)).all()
+
+
+def _all_ilike(document, terms):
+    return and_(*[document.ilike(f"%{term}%") for term in terms])
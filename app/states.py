@@ -0,0 +1,128 @@
+import json
+import threading
+from abc import ABC, abstractmethod
+from datetime import timedelta
+
+from cachetools import TTLCache
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import ConversationState
+from timezones import utcnow
+
+# Незавершенный диалог забывается через час бездействия
+STATE_TTL = 3600
+
+
+def _dump(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+class StateStore(ABC):
+    """Хранилище состояния диалога: имя шага и словарь скалярных значений (id, строки).
+
+    Значения сериализуются в JSON, поэтому ORM-объекты сохранить в нем нельзя.
+    """
+
+    @abstractmethod
+    def get(self, user_id):
+        """Возвращает (state, data) или None, если диалога нет или он истек."""
+
+    @abstractmethod
+    def set(self, user_id, state, data=None):
+        pass
+
+    @abstractmethod
+    def delete(self, user_id):
+        pass
+
+    def purge_expired(self, context=None):
+        """Удаляет истекшие диалоги; вызывается периодически."""
+
+
+class MemoryStateStore(StateStore):
+    """LRU с TTL в памяти процесса: размер ограничен maxsize независимо от числа брошенных диалогов."""
+
+    def __init__(self, maxsize=100000, ttl=STATE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            value = self._cache.get(user_id)
+        if value is None:
+            return None
+        state, data = value
+        return state, json.loads(data)
+
+    def set(self, user_id, state, data=None):
+        value = (state, _dump(data or {}))
+        with self._lock:
+            self._cache[user_id] = value
+
+    def delete(self, user_id):
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def purge_expired(self, context=None):
+        with self._lock:
+            self._cache.expire()
+
+
+class SQLStateStore(StateStore):
+    """Состояние в таблице conversation_states: переживает рестарт и доступно всем процессам."""
+
+    def __init__(self, session_factory, ttl=STATE_TTL):
+        self.Session = session_factory
+        self.ttl = timedelta(seconds=ttl)
+
+    def get(self, user_id):
+        with self.Session() as session:
+            row = session.execute(
+                select(ConversationState.state, ConversationState.data).where(
+                    ConversationState.user_id == user_id,
+                    ConversationState.expires_at > utcnow(),
+                )
+            ).first()
+        if row is None:
+            return None
+        return row.state, json.loads(row.data)
+
+    def set(self, user_id, state, data=None):
+        values = {
+            "user_id": user_id,
+            "state": state,
+            "data": _dump(data or {}),
+            "expires_at": utcnow() + self.ttl,
+        }
+        with self.Session() as session:
+            dialect = session.get_bind().dialect.name
+            if dialect in ("postgresql", "sqlite"):
+                insert = (postgresql if dialect == "postgresql" else sqlite).insert
+                statement = insert(ConversationState).values(**values)
+                statement = statement.on_conflict_do_update(
+                    index_elements=[ConversationState.user_id],
+                    set_={key: statement.excluded[key] for key in ("state", "data", "expires_at")},
+                )
+                session.execute(statement)
+            else:
+                session.merge(ConversationState(**values))
+            session.commit()
+
+    def delete(self, user_id):
+        with self.Session() as session:
+            session.execute(delete(ConversationState).where(ConversationState.user_id == user_id))
+            session.commit()
+
+    def purge_expired(self, context=None):
+        with self.Session() as session:
+            session.execute(delete(ConversationState).where(ConversationState.expires_at <= utcnow()))
+            session.commit()
+
+
+def create_state_store(backend, session_factory, ttl=STATE_TTL, maxsize=100000):
+    if backend == "memory":
+        return MemoryStateStore(maxsize=maxsize, ttl=ttl)
+    if backend == "sql":
+        return SQLStateStore(session_factory, ttl=ttl)
+    raise ValueError(f"Неизвестное хранилище состояний: {backend}")
@@ -0,0 +1,44 @@
+"""Часовые пояса пользователей.
+
+Все моменты времени хранятся и сравниваются в UTC; в местное время пользователя
+они переводятся только при разборе ввода и при выводе. ZoneInfo кэшируется по
+имени, так что перевод не обращается к базе tzdata на каждое сообщение.
+"""
+import os
+from datetime import datetime, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Пояс пользователей, которые не выбрали свой командой /timezone
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Europe/Moscow")
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
+@lru_cache(maxsize=None)
+def get_zone(name):
+    """ZoneInfo по имени IANA; ValueError, если такого пояса нет."""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        raise ValueError(f"Неизвестный часовой пояс: {name}") from e
+
+
+def user_zone(name):
+    return get_zone(name or DEFAULT_TIMEZONE)
+
+
+def to_utc(local, zone):
+    """Местное время без пояса (как ввел пользователь) в aware UTC."""
+    if local.tzinfo is None:
+        local = local.replace(tzinfo=zone)
+    return local.astimezone(timezone.utc)
+
+
+def to_local(moment, zone):
+    """Момент из БД в местное время пользователя; наивное значение считается UTC."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(zone)
@@ -0,0 +1,160 @@
+"""Импорт и экспорт заметок файлами JSON Lines и CSV.
+
+Экспорт читает заметки серверным курсором (yield_per) и пишет их во временный
+файл, который держится в памяти только до EXPORT_SPOOL_SIZE, поэтому память не
+зависит от числа заметок. Импорт разбирает файл построчно и вставляет заметки
+порциями по IMPORT_CHUNK_SIZE, каждая порция — отдельная транзакция. Даты в
+файлах — в местном времени пользователя (пояс zone), в БД — в UTC.
+"""
+import csv
+import io
+import json
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import insert, select
+
+from database import Note
+from flows import DATE_FORMAT
+from timezones import to_local, to_utc, utcnow
+
+FORMATS = ("jsonl", "csv")
+FIELDS = ("title", "content", "created_at")
+EXPORT_BATCH_SIZE = 1000
+EXPORT_SPOOL_SIZE = 1024 * 1024
+IMPORT_CHUNK_SIZE = 1000
+# Bot API отдает боту файлы не больше 20 МБ
+IMPORT_MAX_SIZE = 20 * 1024 * 1024
+TITLE_MAX_LENGTH = Note.__table__.c.title.type.length
+
+
+def detect_format(filename):
+    extension = (filename or "").rsplit(".", 1)[-1].lower()
+    if extension in ("jsonl", "ndjson"):
+        return "jsonl"
+    if extension == "csv":
+        return "csv"
+    return None
+
+
+def export_notes(session_factory, user_id, fmt, zone, batch_size=EXPORT_BATCH_SIZE):
+    """Пишет заметки пользователя во временный файл; возвращает (файл на начале, число заметок)."""
+    out = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    writer = csv.writer(text) if fmt == "csv" else None
+    if writer:
+        writer.writerow(FIELDS)
+
+    count = 0
+    statement = (
+        select(Note.title, Note.content, Note.created_at)
+        .where(Note.user_id == user_id)
+        .order_by(Note.created_at, Note.note_id)
+        .execution_options(yield_per=batch_size)
+    )
+    with session_factory() as session:
+        for title, content, created_at in session.execute(statement):
+            created_at = to_local(created_at, zone).strftime(DATE_FORMAT) if created_at else ""
+            if writer:
+                writer.writerow((title, content, created_at))
+            else:
+                text.write(json.dumps(
+                    {"title": title, "content": content, "created_at": created_at}, ensure_ascii=False
+                ))
+                text.write("\n")
+            count += 1
+
+    text.flush()
+    text.detach()
+    out.seek(0)
+    return out, count
+
+
+def read_notes(stream, fmt, zone):
+    """Разбирает двоичный поток построчно; выдает (номер строки, dict или None для некорректной строки)."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, _note_values(record, zone)
+    else:
+        for line_num, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_num, None
+                continue
+            yield line_num, _note_values(record, zone) if isinstance(record, dict) else None
+
+
+def _note_values(record, zone):
+    title = record.get("title")
+    content = record.get("content")
+    created_at = record.get("created_at")
+    if not isinstance(title, str) or not title.strip() or len(title) > TITLE_MAX_LENGTH:
+        return None
+    if not isinstance(content, str):
+        return None
+    if created_at:
+        try:
+            created_at = datetime.strptime(created_at, DATE_FORMAT)
+        except (TypeError, ValueError):
+            try:
+                created_at = datetime.fromisoformat(created_at)
+            except (TypeError, ValueError):
+                return None
+        # ISO-время со смещением переводится как есть, без смещения — из пояса пользователя
+        created_at = to_utc(created_at, zone)
+    else:
+        created_at = utcnow()
+    return {"title": title, "content": content, "created_at": created_at}
+
+
+def import_notes(session_factory, user_id, records, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """Вставляет заметки из read_notes порциями; возвращает (вставлено, пропущено строк).
+
+    progress(imported, skipped) вызывается после коммита каждой порции.
+    """
+    imported = skipped = 0
+    chunk = []
+    for _, values in records:
+        if values is None:
+            skipped += 1
+            continue
+        values["user_id"] = user_id
+        chunk.append(values)
+        if len(chunk) >= chunk_size:
+            imported += _insert_chunk(session_factory, chunk)
+            chunk = []
+            if progress:
+                progress(imported, skipped)
+    if chunk:
+        imported += _insert_chunk(session_factory, chunk)
+    return imported, skipped
+
+
+def _insert_chunk(session_factory, chunk):
+    with session_factory() as session:
+        connection = session.connection()
+        if connection.dialect.driver == "psycopg2":
+            _copy_notes(connection, chunk)
+        else:
+            # executemany; SQLAlchemy 2.0 сворачивает его в многострочный INSERT
+            session.execute(insert(Note), chunk)
+        session.commit()
+    return len(chunk)
+
+
+def _copy_notes(connection, chunk):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for values in chunk:
+        writer.writerow((values["title"], values["content"], values["created_at"].isoformat(), values["user_id"]))
+    buffer.seek(0)
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert("COPY notes (title, content, created_at, user_id) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
@@ -1,4 +1,32 @@
-from datetime import datetime
+from datetime import datetime, timezone
 
 def get_current_time():
     return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+PAGE_KEY_FORMAT = '%Y%m%d%H%M%S%f'
+
+def encode_page_key(created_at, note_id):
+    """Ключ keyset-пагинации (created_at в UTC, note_id) в компактном виде для callback_data."""
+    return f"{created_at.astimezone(timezone.utc).strftime(PAGE_KEY_FORMAT)}:{note_id}"
+
+def decode_page_key(value):
+    created_at, note_id = value.split(':')
+    return datetime.strptime(created_at, PAGE_KEY_FORMAT).replace(tzinfo=timezone.utc), int(note_id)
+
+def format_ids(ids):
+    """Сворачивает отсортированные ID в строку с диапазонами: [1, 2, 3, 7] -> «1–3, 7»."""
+    parts = []
+    start = previous = None
+    for note_id in ids:
+        if previous is not None and note_id == previous + 1:
+            previous = note_id
+            continue
+        if start is not None:
+            parts.append(str(start) if start == previous else f"{start}–{previous}")
+        start = previous = note_id
+    if start is not None:
+        parts.append(str(start) if start == previous else f"{start}–{previous}")
+    return ", ".join(parts)
+
+def shorten(text, limit):
+    return text if len(text) <= limit else text[:limit - 1] + '…'
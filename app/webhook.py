@@ -0,0 +1,241 @@
+"""Прием обновлений через webhook с распределением по нескольким процессам.
+
+Роутер (tornado) принимает POST от Telegram и раскладывает обновления по
+очередям воркеров по user_id, поэтому все обновления одного пользователя
+обрабатывает один и тот же воркер в исходном порядке. Каждый воркер — отдельный
+процесс со своим NoteBot, который обрабатывает только свою долю пользователей и
+их напоминаний.
+Воркеры периодически присылают роутеру снимок своих метрик, и роутер отдает их
+вместе на /metrics с меткой worker.
+"""
+import json
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+
+from telegram import Bot, Update
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.web import Application, RequestHandler
+
+from metrics import PROMETHEUS_CONTENT_TYPE, merge_expositions
+
+logger = logging.getLogger(__name__)
+
+# Как часто воркер отправляет роутеру снимок метрик, секунды
+METRICS_PUSH_INTERVAL = 5
+
+# Типы обновлений, которые несут пользователя (from или user); у постов в каналах его нет, только chat
+_UPDATE_KEYS = ("message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+                "shipping_query", "pre_checkout_query", "poll_answer", "my_chat_member", "chat_member",
+                "chat_join_request", "channel_post", "edited_channel_post")
+
+
+def update_user_id(data):
+    """Достает из сырого обновления идентификатор пользователя (или чата канала) для шардирования.
+
+    Планировщик напоминаний, архиватор и состояние диалога делятся по user_id, поэтому по нему же
+    раскладываются и обновления: иначе в группе сообщения пользователя и его напоминания попадали бы
+    в разные воркеры с разными кэшами.
+    """
+    for key in _UPDATE_KEYS:
+        if key in data:
+            payload = data[key]
+            sender = payload.get("from") or payload.get("user")
+            if sender:
+                return sender["id"]
+            chat = payload.get("chat") or payload.get("sender_chat") or {}
+            return chat.get("id", 0)
+    return 0
+
+
+def shard_of(user_id, count):
+    return abs(user_id) % count
+
+
+def _push_metrics(note_bot, index, snapshots, stopped):
+    while not stopped.wait(METRICS_PUSH_INTERVAL):
+        profile = note_bot.profiler.folded() if note_bot.profiler else ""
+        try:
+            snapshots.put_nowait((index, note_bot.metrics.render({"worker": index}), profile))
+        except queue.Full:
+            # Роутер не успевает забирать снимки; следующий все равно будет свежее
+            pass
+
+
+def _run_worker(bot_factory, index, count, updates, snapshots):
+    # Сигналы обрабатывает роутер: он сам пришлет None, когда пора заканчивать
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    note_bot = bot_factory((index, count))
+    note_bot.start_monitoring(serve=False)
+    stopped = threading.Event()
+    threading.Thread(
+        target=_push_metrics, args=(note_bot, index, snapshots, stopped), name="metrics-push", daemon=True
+    ).start()
+    # add_jobs сам запускает job_queue до добавления задач, иначе первый опрос ушел бы на interval позже
+    note_bot.add_jobs()
+    note_bot.outbound.start()
+    bot = note_bot.updater.bot
+    try:
+        while True:
+            data = updates.get()
+            if data is None:
+                break
+            note_bot.dispatcher.process_update(Update.de_json(data, bot))
+    finally:
+        stopped.set()
+        note_bot.job_queue.stop()
+        if note_bot.writes is not None:
+            note_bot.writes.stop()
+        note_bot.outbound.stop()
+        note_bot.reminders.flush()
+
+
+class _UpdateHandler(RequestHandler):
+    def initialize(self, router):
+        self.router = router
+
+    def post(self):
+        secret = self.router.secret
+        if secret and self.request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            self.set_status(403)
+            return
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            self.set_status(400)
+            return
+        if not self.router.dispatch(data):
+            # Очередь воркера переполнена: Telegram повторит доставку позже
+            self.set_status(503)
+
+
+class _MetricsHandler(RequestHandler):
+    def initialize(self, router):
+        self.router = router
+
+    def get(self):
+        self.router.collect_metrics()
+        self.set_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.write(merge_expositions(self.router.metrics[index] for index in sorted(self.router.metrics)))
+
+
+class _ProfileHandler(RequestHandler):
+    def initialize(self, router):
+        self.router = router
+
+    def get(self):
+        self.router.collect_metrics()
+        self.set_header("Content-Type", "text/plain; charset=utf-8")
+        # Стеки воркеров склеиваются: flamegraph сам сложит одинаковые строки
+        self.write("".join(self.router.profiles[index] for index in sorted(self.router.profiles)))
+
+
+class WebhookRouter:
+    path = "/webhook"
+
+    def __init__(self, bot_factory, token, url, port=5555, workers=4, secret=None, base_url=None,
+                 listen="0.0.0.0", queue_size=10000, drain_timeout=30, prepare=None):
+        self.bot_factory = bot_factory
+        self.token = token
+        self.url = url
+        self.port = port
+        self.workers = workers
+        self.secret = secret
+        self.base_url = base_url
+        self.listen = listen
+        self.drain_timeout = drain_timeout
+        self.prepare = prepare
+
+        self._context = multiprocessing.get_context("fork")
+        self._queues = [self._context.Queue(queue_size) for _ in range(workers)]
+        self._snapshots = self._context.Queue(workers * 4)
+        # Последние снимки метрик и стеков профилировщика по номеру воркера
+        self.metrics = {}
+        self.profiles = {}
+        self._processes = [None] * workers
+        self._server = None
+        self._stopping = False
+
+    def dispatch(self, data):
+        index = shard_of(update_user_id(data), self.workers)
+        try:
+            self._queues[index].put_nowait(data)
+        except queue.Full:
+            logger.warning("Очередь воркера %s переполнена", index)
+            return False
+        return True
+
+    def run(self):
+        if self.prepare:
+            self.prepare()
+        for index in range(self.workers):
+            self._spawn(index)
+
+        app = Application([
+            (self.path, _UpdateHandler, {"router": self}),
+            ("/metrics", _MetricsHandler, {"router": self}),
+            ("/profile", _ProfileHandler, {"router": self}),
+        ])
+        self._server = HTTPServer(app)
+        self._server.listen(self.port, address=self.listen)
+
+        bot = Bot(token=self.token, base_url=self.base_url)
+        bot.set_webhook(url=self.url.rstrip("/") + self.path, secret_token=self.secret)
+        logger.info("Webhook %s, воркеров: %s", self.url, self.workers)
+
+        loop = IOLoop.current()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: loop.add_callback_from_signal(self.shutdown))
+        PeriodicCallback(self._respawn_dead, 5000).start()
+        loop.start()
+
+    def shutdown(self):
+        """Перестает принимать обновления, дает воркерам дообработать очереди и завершает цикл."""
+        if self._stopping:
+            return
+        self._stopping = True
+        self._server.stop()
+        # Webhook не снимается: пока нас нет, Telegram копит обновления и доставит их после рестарта
+        for updates in self._queues:
+            updates.put(None)
+        loop = IOLoop.current()
+        loop.run_in_executor(None, self._join_workers).add_done_callback(lambda _: loop.stop())
+
+    def collect_metrics(self):
+        """Забирает присланные воркерами снимки метрик."""
+        while True:
+            try:
+                index, text, profile = self._snapshots.get_nowait()
+            except queue.Empty:
+                return
+            self.metrics[index] = text
+            self.profiles[index] = profile
+
+    def _join_workers(self):
+        for process in self._processes:
+            process.join(self.drain_timeout)
+            if process.is_alive():
+                logger.warning("Воркер %s не завершился за %s с", process.name, self.drain_timeout)
+                process.terminate()
+
+    def _spawn(self, index):
+        process = self._context.Process(
+            target=_run_worker,
+            args=(self.bot_factory, index, self.workers, self._queues[index], self._snapshots),
+            name=f"bot-worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+
+    def _respawn_dead(self):
+        if self._stopping:
+            return
+        for index, process in enumerate(self._processes):
+            if not process.is_alive():
+                logger.warning("Воркер %s завершился с кодом %s, перезапуск", index, process.exitcode)
+                self._spawn(index)
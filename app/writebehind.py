@@ -0,0 +1,167 @@
+"""Отложенная пакетная запись созданий и изменений заметок (write-behind).
+
+Обработчик не ждет коммита: он ставит запись в очередь NoteWriter и сразу
+освобождает поток диспетчера. Фоновый поток собирает записи от разных
+пользователей и применяет их одной транзакцией — через max_delay секунд после
+первой записи пакета или как только их набралось max_batch. Пока идет коммит,
+копится следующий пакет, поэтому под нагрузкой на один fsync приходится много
+записей. Подтверждение пользователю (on_done) вызывается только после коммита.
+"""
+import logging
+import threading
+from time import monotonic
+
+from sqlalchemy import insert, update
+
+from database import Note
+
+logger = logging.getLogger(__name__)
+
+MAX_DELAY = 0.02
+MAX_BATCH = 100
+
+
+class _Write:
+    __slots__ = ("kind", "user_id", "note_id", "values", "on_done", "on_failed", "submitted", "result")
+
+    def __init__(self, kind, user_id, note_id, values, on_done, on_failed):
+        self.kind = kind
+        self.user_id = user_id
+        self.note_id = note_id
+        self.values = values
+        self.on_done = on_done
+        self.on_failed = on_failed
+        self.submitted = monotonic()
+        self.result = None
+
+
+class NoteWriter:
+    """Очередь записей в notes с групповым коммитом.
+
+    on_done(result) получает note_id созданной заметки или True/False для
+    изменения (нашлась ли заметка), on_failed(error) — исключение. Оба вызываются
+    из потока записи и не должны блокироваться: ответ пользователю лучше
+    отправлять через OutboundQueue. publish(session, user_id, note_id) ставит в
+    транзакцию уведомление об изменении (см. NoteCache.publish).
+    on_flush(rows, seconds, waits, retried) получает размер пакета, длительность
+    транзакции, время ожидания каждой записи от постановки до коммита и признак
+    того, что пакет пришлось применять по одной записи.
+    """
+
+    def __init__(self, session_factory, max_delay=MAX_DELAY, max_batch=MAX_BATCH, publish=None, on_flush=None):
+        self.Session = session_factory
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.publish = publish
+        self.on_flush = on_flush
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def create(self, user_id, title, content, created_at, on_done=None, on_failed=None):
+        values = {"user_id": user_id, "title": title, "content": content, "created_at": created_at}
+        self._submit(_Write("create", user_id, None, values, on_done, on_failed))
+
+    def update(self, user_id, note_id, values, on_done=None, on_failed=None):
+        self._submit(_Write("update", user_id, note_id, values, on_done, on_failed))
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def stop(self, timeout=None):
+        """Дописывает все, что уже в очереди, и останавливает поток записи."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _submit(self, write):
+        with self._cond:
+            # Поток запускается при первой записи: NoteBot создается и до fork воркеров webhook
+            if self._thread is None:
+                self._running = True
+                self._thread = threading.Thread(target=self._run, name="note-writer", daemon=True)
+                self._thread.start()
+            self._pending.append(write)
+            self._cond.notify()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                if not self._running:
+                    return None
+                self._cond.wait()
+            deadline = self._pending[0].submitted + self.max_delay
+            while self._running and len(self._pending) < self.max_batch:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._flush(batch)
+
+    def _flush(self, batch):
+        started = monotonic()
+        retried = False
+        try:
+            self._apply(batch)
+            failed = {}
+        except Exception as error:
+            # Одна ошибочная запись (например, удаленный пользователь) не должна ронять весь пакет
+            logger.warning("Пакет из %d записей не применен, повтор по одной: %s", len(batch), error)
+            retried = True
+            failed = {}
+            for write in batch:
+                try:
+                    self._apply([write])
+                except Exception as single_error:
+                    failed[id(write)] = single_error
+        finished = monotonic()
+
+        if self.on_flush:
+            self.on_flush(len(batch), finished - started, [finished - write.submitted for write in batch], retried)
+        for write in batch:
+            error = failed.get(id(write))
+            callback, argument = (write.on_failed, error) if error is not None else (write.on_done, write.result)
+            if callback is None:
+                continue
+            try:
+                callback(argument)
+            except Exception:
+                logger.exception("Ошибка в обработчике завершения записи")
+
+    def _apply(self, batch):
+        creates = [write for write in batch if write.kind == "create"]
+        with self.Session() as session:
+            if creates:
+                # Один INSERT ... RETURNING на все новые заметки; порядок ID совпадает с порядком строк
+                note_ids = session.execute(
+                    insert(Note).returning(Note.note_id, sort_by_parameter_order=True),
+                    [write.values for write in creates],
+                ).scalars().all()
+                for write, note_id in zip(creates, note_ids):
+                    write.result = note_id
+            for write in batch:
+                if write.kind != "update":
+                    continue
+                updated = session.execute(
+                    update(Note)
+                    .where(Note.note_id == write.note_id, Note.user_id == write.user_id)
+                    .values(**write.values),
+                    execution_options={"synchronize_session": False},
+                ).rowcount
+                if updated and self.publish:
+                    self.publish(session, write.user_id, write.note_id)
+                write.result = updated > 0
+            session.commit()
@@ -0,0 +1,126 @@
+"""Сравнение пропускной способности NoteBot в режимах threaded и async.
+
+Каждый режим запускается в отдельном процессе против локальной заглушки Bot API
+и SQLite (или --database-url). Пример:
+
+    python benchmarks/bench_modes.py --users 200 --messages 5 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(BENCH_DIR, "..", "app")
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.abspath(APP_DIR))
+
+from fake_telegram import FakeTelegram, message_update
+
+
+def build_updates(users, messages):
+    updates = []
+    for n in range(messages):
+        for user_id in range(1, users + 1):
+            text = "/start" if n == 0 else "View Notes"
+            updates.append(message_update(len(updates) + 1, 1000 + user_id, text))
+    return updates
+
+
+def run_mode(mode, args):
+    updates = build_updates(args.users, args.messages)
+    api = FakeTelegram(updates, latency=args.latency).start()
+    done = api.expect(len(updates))
+
+    os.environ["TOKEN"] = "123456:bench"
+    os.environ["TELEGRAM_BASE_URL"] = api.base_url
+    os.environ["DATABASE_URL"] = args.database_url
+    # Синтетические пользователи шлют быстрее живых: лимиты входящих обновлений исказили бы замер
+    os.environ.setdefault("INGRESS_USER_RATE", "0")
+    os.environ.setdefault("INGRESS_CONCURRENCY", "0")
+    import bot
+    import database
+
+    # Схему рабочей БД ведет Alembic; одноразовой базе бенчмарка хватает create_all
+    database.create_tables()
+
+    if mode == "threaded":
+        note_bot = bot.NoteBot()
+        note_bot.outbound.start()
+        note_bot.updater.start_polling(poll_interval=0, timeout=1)
+        finished = done.wait(args.timeout)
+        note_bot.updater.stop()
+        note_bot.outbound.stop()
+    else:
+        from aio import AsyncRequest, AsyncRunner, async_session_factory
+
+        note_bot = bot.NoteBot(
+            bot=bot.Bot(token=bot.token, base_url=api.base_url, request=AsyncRequest()),
+            session_factory=async_session_factory(args.database_url),
+        )
+        runner = AsyncRunner(note_bot, poll_timeout=1)
+
+        async def main():
+            stop = asyncio.Event()
+            serving = asyncio.create_task(runner.serve(stop))
+            result = await asyncio.to_thread(done.wait, args.timeout)
+            stop.set()
+            await serving
+            return result
+
+        finished = asyncio.run(main())
+
+    api.stop()
+    elapsed = api.sent[-1][0] - api.first_poll_at if api.sent else 0.0
+    return {
+        "mode": mode,
+        "updates": len(updates),
+        "replies": len(api.sent),
+        "finished": finished,
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(len(api.sent) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=5, help="сообщений от каждого пользователя")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа Bot API, секунд")
+    parser.add_argument("--database-url", help="по умолчанию — временная SQLite")
+    parser.add_argument("--modes", nargs="+", default=["threaded", "async"], choices=["threaded", "async"])
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--run", choices=["threaded", "async"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_mode(args.run, args)))
+        return
+
+    results = []
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            database_url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            command = [
+                sys.executable, __file__, "--run", mode,
+                "--users", str(args.users), "--messages", str(args.messages),
+                "--latency", str(args.latency), "--database-url", database_url,
+                "--timeout", str(args.timeout),
+            ]
+            started = time.monotonic()
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            result["wall_seconds"] = round(time.monotonic() - started, 3)
+            results.append(result)
+
+    print(f"{'mode':<10}{'updates':>9}{'replies':>9}{'seconds':>10}{'upd/s':>10}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['updates']:>9}{r['replies']:>9}{r['seconds']:>10}{r['updates_per_second']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Время холодного старта NoteBot: от запуска процесса до ответа на первое обновление.
+
+Каждый прогон запускает python app/bot.py отдельным процессом против локальной
+заглушки Bot API, в которой уже лежит /start, и замеряет два момента: первый
+getUpdates (импорты и инициализация закончены) и первый sendMessage (обработано
+первое обновление, включая первое соединение с БД). Схема создается один раз до
+прогонов, так что в замер попадает только сам старт. Пример:
+
+    python benchmarks/bench_startup.py --runs 10 --modes threaded async
+    python benchmarks/bench_startup.py --importtime 15
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.abspath(os.path.join(BENCH_DIR, "..", "app"))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_telegram import FakeTelegram, message_update
+
+
+def bot_env(args, mode, base_url):
+    env = dict(os.environ)
+    env.update(
+        TOKEN="123456:bench",
+        TELEGRAM_BASE_URL=base_url,
+        DATABASE_URL=args.database_url,
+        BOT_MODE=mode,
+        # HTTP-сервер метрик и профилировщик к старту не относятся и занимали бы порт между прогонами
+        METRICS_PORT="0",
+        PROFILE_INTERVAL="0",
+    )
+    return env
+
+
+def create_schema(database_url):
+    env = dict(os.environ, DATABASE_URL=database_url, TOKEN="123456:bench")
+    subprocess.run([sys.executable, "-c", "import database; database.create_tables()"], cwd=APP_DIR, env=env, check=True)
+
+
+def run_once(args, mode):
+    api = FakeTelegram([message_update(1, 1001, "/start")]).start()
+    replied = api.expect(1)
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(APP_DIR, "bot.py")],
+        cwd=APP_DIR,
+        env=bot_env(args, mode, api.base_url),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL if not args.verbose else None,
+    )
+    try:
+        finished = replied.wait(args.timeout)
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        api.stop()
+    if not finished:
+        return None
+    return {
+        "first_poll": api.first_poll_at - started,
+        "first_reply": api.sent[0][0] - started,
+    }
+
+
+def summary(values):
+    return {
+        "median": round(statistics.median(values) * 1000, 1),
+        "min": round(min(values) * 1000, 1),
+        "max": round(max(values) * 1000, 1),
+    }
+
+
+def import_profile(args, top):
+    """Самые дорогие импорты bot.py по python -X importtime (накопительное время, мс)."""
+    env = bot_env(args, "threaded", "http://127.0.0.1:9/bot")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import bot"], cwd=APP_DIR, env=env,
+                            capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match:
+            rows.append((int(match.group(2)) / 1000, len(match.group(3)), match.group(4)))
+    # Сам bot и его прямые импорты: их накопительное время уже включает все зависимости
+    outer = min((depth for _, depth, _ in rows), default=0)
+    rows = sorted((row for row in rows if row[1] <= outer + 2), reverse=True)[:top]
+    return [{"module": name, "cumulative_ms": round(ms, 1)} for ms, _, name in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=["threaded", "async"], choices=["threaded", "async"])
+    parser.add_argument("--database-url", help="по умолчанию — временный файл SQLite")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--importtime", type=int, metavar="N", default=0,
+                        help="также показать N самых дорогих импортов bot.py")
+    parser.add_argument("--verbose", action="store_true", help="не скрывать stderr бота")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.database_url:
+            args.database_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        create_schema(args.database_url)
+
+        report = {"runs": args.runs, "modes": {}}
+        for mode in args.modes:
+            results = [run_once(args, mode) for _ in range(args.runs)]
+            completed = [result for result in results if result]
+            report["modes"][mode] = {
+                "completed": len(completed),
+                "first_poll_ms": summary([r["first_poll"] for r in completed]) if completed else None,
+                "first_reply_ms": summary([r["first_reply"] for r in completed]) if completed else None,
+            }
+        if args.importtime:
+            report["imports"] = import_profile(args, args.importtime)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    for mode, result in report["modes"].items():
+        print(f"{mode}: {result['completed']}/{args.runs} прогонов")
+        if result["completed"]:
+            for key, title in (("first_poll_ms", "до первого getUpdates"), ("first_reply_ms", "до первого ответа")):
+                stats = result[key]
+                print(f"  {title}: медиана {stats['median']} мс, мин {stats['min']}, макс {stats['max']}")
+    for row in report.get("imports", []):
+        print(f"  {row['cumulative_ms']:>8} мс  {row['module']}")
+
+
+if __name__ == "__main__":
+    main()
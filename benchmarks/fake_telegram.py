@@ -0,0 +1,146 @@
+"""Локальная заглушка Telegram Bot API для бенчмарков.
+
+Отдает через getUpdates заранее подготовленные обновления, принимает sendMessage
+и прочие методы, записывая время каждого ответа бота. latency эмулирует сетевую
+задержку до api.telegram.org. on_send(method, chat_id, text) вызывается после
+каждого отправленного ботом сообщения, что позволяет строить замкнутые сценарии:
+следующее обновление пользователя появляется только после ответа на предыдущее.
+"""
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class FakeTelegram:
+    def __init__(self, updates=(), latency=0.0, host="127.0.0.1", port=0, on_send=None):
+        self.latency = latency
+        self.on_send = on_send
+        self.sent = []
+        self.first_poll_at = None
+        self._updates = deque(updates)
+        self._message_id = 0
+        self._lock = threading.Lock()
+        self._expected = None
+        self._done = threading.Event()
+
+        handler = type("Handler", (_Handler,), {"api": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.server.server_port}/bot"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def push(self, *updates):
+        with self._lock:
+            self._updates.extend(updates)
+
+    def expect(self, replies):
+        """Событие сработает, когда бот отправит replies сообщений."""
+        with self._lock:
+            self._expected = replies
+            if len(self.sent) >= replies:
+                self._done.set()
+        return self._done
+
+    def call(self, method, params):
+        if method == "getUpdates":
+            return self._get_updates(params)
+        if self.latency:
+            time.sleep(self.latency)
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText", "sendDocument"):
+            return self._record(method, params)
+        return True
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        deadline = time.monotonic() + min(float(params.get("timeout") or 0), 0.05)
+        with self._lock:
+            if self.first_poll_at is None:
+                self.first_poll_at = time.monotonic()
+        while True:
+            with self._lock:
+                # Как и настоящий API, offset подтверждает все обновления до него
+                while self._updates and self._updates[0]["update_id"] < offset:
+                    self._updates.popleft()
+                batch = [self._updates[i] for i in range(min(limit, len(self._updates)))]
+            if batch or time.monotonic() >= deadline:
+                return batch
+            time.sleep(0.005)
+
+    def _record(self, method, params):
+        chat_id = int(params.get("chat_id") or 0)
+        with self._lock:
+            self._message_id += 1
+            self.sent.append((time.monotonic(), method, chat_id, params.get("text")))
+            if self._expected is not None and len(self.sent) >= self._expected:
+                self._done.set()
+            message_id = self._message_id
+        if self.on_send:
+            self.on_send(method, chat_id, params.get("text") or "")
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text") or "",
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело уходят отдельными записями; без этого Nagle и отложенный ACK добавляют ~40 мс к ответу
+    disable_nagle_algorithm = True
+    api = None
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length)
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("application/json"):
+            params = json.loads(raw or b"{}")
+        elif content_type.startswith("application/x-www-form-urlencoded"):
+            params = {k: v[0] for k, v in parse_qs(raw.decode()).items()}
+        else:
+            # multipart (отправка файлов): содержимое бенчмарку не нужно
+            params = {}
+        method = self.path.rsplit("/", 1)[-1]
+        body = json.dumps({"ok": True, "result": self.api.call(method, params)}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+
+def message_update(update_id, user_id, text):
+    """Синтетическое обновление с текстовым сообщением от пользователя user_id."""
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+# Модули бота импортируются из app/ по коротким именам, как при запуске python app/bot.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("TOKEN", "123456:test")
+
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from database import Base, User  # noqa: E402
+from engine import make_engine  # noqa: E402
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Фабрика сессий поверх отдельной файловой SQLite: ее видят и фоновые потоки."""
+    engine = make_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    with factory() as session:
+        session.add(User(user_id=1, username="user1"))
+        session.commit()
+    yield factory
+    engine.dispose()
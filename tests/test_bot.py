@@ -0,0 +1,66 @@
+import threading
+from datetime import timedelta
+
+import pytest
+
+from bot import REMINDER_RETRY_DELAY, NoteBot
+from database import Note
+from timezones import utcnow
+
+
+@pytest.fixture
+def note_bot(session_factory):
+    return NoteBot(session_factory=session_factory, write_behind=False)
+
+
+def add_due_reminders(note_bot, count):
+    with note_bot.Session() as session:
+        note = Note(user_id=1, title="t", content="c")
+        session.add(note)
+        session.flush()
+        reminders = note_bot.reminders.add_many(session, 1, [note.note_id] * count, utcnow() - timedelta(minutes=1))
+        reminder_ids = [reminder.reminder_id for reminder in reminders]
+        session.commit()
+    note_bot.reminders.poll()
+    return reminder_ids
+
+
+def test_send_reminder_returns_batch_when_enqueue_fails(note_bot, monkeypatch):
+    reminder_ids = add_due_reminders(note_bot, 2)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("outbound is down")
+
+    monkeypatch.setattr(note_bot.outbound, "send", broken)
+    with pytest.raises(RuntimeError):
+        note_bot.send_reminder(None)
+    assert note_bot.reminders.pop_due() == []
+    retried = note_bot.reminders.pop_due(utcnow() + timedelta(seconds=REMINDER_RETRY_DELAY + 1))
+    assert sorted(reminder_id for _, reminder_id in retried) == reminder_ids
+
+
+def test_send_reminder_returns_only_unsent_part(note_bot, monkeypatch):
+    first, second = add_due_reminders(note_bot, 2)
+    sent = []
+
+    def send(chat_id, text, **kwargs):
+        if sent:
+            raise RuntimeError("outbound is down")
+        sent.append(chat_id)
+
+    monkeypatch.setattr(note_bot.outbound, "send", send)
+    with pytest.raises(RuntimeError):
+        note_bot.send_reminder(None)
+    retried = note_bot.reminders.pop_due(utcnow() + timedelta(seconds=REMINDER_RETRY_DELAY + 1))
+    assert [reminder_id for _, reminder_id in retried] == [second]
+
+
+def test_first_poll_runs_right_after_start(note_bot, monkeypatch):
+    polled = threading.Event()
+    monkeypatch.setattr(note_bot.reminders, "poll", lambda context=None: polled.set())
+    note_bot.add_jobs()
+    try:
+        # Интервал опроса — REMINDER_POLL_INTERVAL, а первый запуск должен быть сразу
+        assert polled.wait(5)
+    finally:
+        note_bot.job_queue.stop()
@@ -0,0 +1,22 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import database
+
+APP_DIR = os.path.dirname(database.__file__)
+
+
+def test_create_tables_builds_search_index_without_importing_search(tmp_path):
+    path = tmp_path / "schema.db"
+    # Отдельный процесс: в этом search уже мог быть импортирован другими тестами
+    subprocess.run([sys.executable, "-c", "import database; database.create_tables()"], cwd=APP_DIR,
+                   env=dict(os.environ, DATABASE_URL=f"sqlite:///{path}"), check=True)
+    with sqlite3.connect(path) as connection:
+        tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"users", "notes", "notes_fts", "reminders", "notes_archive", "conversation_states"} <= tables
+
+
+def test_engine_is_created_only_on_demand():
+    assert not hasattr(database, "engine")
@@ -0,0 +1,147 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+
+from flows import MAX_NOTE_IDS, NEVER_FIRES_TEXT, ConversationFlow, InvalidInput, parse_date, parse_note_ids, \
+    parse_repeat
+from states import MemoryStateStore
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("7", [7]),
+    ("12, 15,20-22", [12, 15, 20, 21, 22]),
+    ("3,1,3,2-3", [1, 2, 3]),
+    (" 5 - 6 ,", [5, 6]),
+])
+def test_parse_note_ids(text, expected):
+    assert parse_note_ids(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", ",", "abc", "0", "-3", "5-2", "1-2-3", f"1-{MAX_NOTE_IDS + 1}"])
+def test_parse_note_ids_rejects(text):
+    with pytest.raises(InvalidInput):
+        parse_note_ids(text)
+
+
+def test_parse_note_ids_limits_total():
+    ranges = f"1-{MAX_NOTE_IDS // 2},{MAX_NOTE_IDS}-{MAX_NOTE_IDS * 2}"
+    with pytest.raises(InvalidInput):
+        parse_note_ids(ranges)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("once", None),
+    ("Нет", None),
+    ("Daily", "daily"),
+    ("monthly", "monthly"),
+    ("0  9 * *   1-5", "0 9 * * 1-5"),
+])
+def test_parse_repeat(text, expected):
+    assert parse_repeat(text) == expected
+
+
+@pytest.mark.parametrize("text", ["hourly", "0 9 * *", "60 9 * * *", "0 9 * * 1-9"])
+def test_parse_repeat_rejects_malformed(text):
+    with pytest.raises(InvalidInput) as error:
+        parse_repeat(text)
+    assert error.value.message != NEVER_FIRES_TEXT
+
+
+def test_parse_repeat_rejects_rule_that_never_fires():
+    with pytest.raises(InvalidInput) as error:
+        parse_repeat("0 0 30 2 *")
+    assert error.value.message == NEVER_FIRES_TEXT
+
+
+class Recorder:
+    """Обработчики шагов и кнопок, которые записывают свои вызовы и ведут состояние в states."""
+
+    def __init__(self):
+        self.states = MemoryStateStore()
+        self.calls = []
+
+    def on_title(self, update, user_id, text, data):
+        self.calls.append(("title", text))
+        self.states.set(user_id, "waiting_for_date", {"title": text})
+
+    def on_date(self, update, user_id, value, data):
+        self.calls.append(("date", value, data["title"]))
+        self.states.delete(user_id)
+
+    def on_file(self, update, user_id, document, data):
+        self.calls.append(("file", document))
+
+    def create(self, update, context):
+        self.calls.append(("create",))
+        self.states.set(update.message.from_user.id, "waiting_for_title")
+
+    def fallback(self, update, context):
+        self.calls.append(("fallback",))
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+@pytest.fixture
+def flow(recorder):
+    return (
+        ConversationFlow(fallback=recorder.fallback)
+        .step("waiting_for_title", recorder.on_title)
+        .step("waiting_for_date", recorder.on_date, parse_date)
+        .step("waiting_for_file", recorder.on_file, kind="document")
+        .button("Create Note", recorder.create)
+    )
+
+
+def send(flow, recorder, text, kind="text", user_id=1):
+    update = MagicMock()
+    update.message.from_user.id = user_id
+    flow.handle(update, None, recorder.states.get(user_id), text, kind)
+    return update
+
+
+def test_steps_move_conversation_forward(flow, recorder):
+    send(flow, recorder, "Create Note")
+    send(flow, recorder, "Title")
+    assert recorder.states.get(1) == ("waiting_for_date", {"title": "Title"})
+    send(flow, recorder, "01.02.2030 10:00")
+    assert recorder.calls == [("create",), ("title", "Title"), ("date", datetime(2030, 2, 1, 10, 0), "Title")]
+    assert recorder.states.get(1) is None
+
+
+def test_invalid_input_keeps_state_and_asks_again(flow, recorder):
+    recorder.states.set(1, "waiting_for_date", {"title": "Title"})
+    update = send(flow, recorder, "tomorrow")
+    update.message.reply_text.assert_called_once_with("Неверный формат даты. Введите в формате ДД.ММ.ГГГГ ЧЧ:ММ.")
+    assert recorder.calls == []
+    assert recorder.states.get(1) == ("waiting_for_date", {"title": "Title"})
+
+
+def test_text_outside_dialog_goes_to_buttons_or_fallback(flow, recorder):
+    send(flow, recorder, "hello")
+    send(flow, recorder, "Create Note", user_id=2)
+    assert recorder.calls == [("fallback",), ("create",)]
+
+
+def test_input_of_other_kind_leaves_step(flow, recorder):
+    # Шаг ждет документ: текст не считается вводом шага и обрабатывается как вне диалога
+    recorder.states.set(1, "waiting_for_file")
+    send(flow, recorder, "hello")
+    send(flow, recorder, "notes.jsonl", kind="document")
+    assert recorder.calls == [("fallback",), ("file", "notes.jsonl")]
+
+
+def test_unknown_state_falls_back(flow, recorder):
+    recorder.states.set(1, "waiting_for_something_removed")
+    send(flow, recorder, "Create Note")
+    assert recorder.calls == [("create",)]
+
+
+def test_duplicate_registration_is_rejected(flow, recorder):
+    with pytest.raises(ValueError):
+        flow.step("waiting_for_title", recorder.on_title)
+    with pytest.raises(ValueError):
+        flow.button("Create Note", recorder.create)
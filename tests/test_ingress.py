@@ -0,0 +1,85 @@
+import threading
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from ingress import BUSY_TEXT, RATE_LIMITED_TEXT, IngressLimiter
+
+
+def message_update(user_id):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), callback_query=None,
+                           effective_message=MagicMock())
+
+
+def test_rate_limit_per_user():
+    rejected = []
+    limiter = IngressLimiter(rate=1, burst=3, on_reject=rejected.append)
+    handled = []
+    handler = limiter.guard(lambda update, context: handled.append(update.effective_user.id))
+    first = message_update(1)
+    for _ in range(5):
+        handler(first, None)
+    handler(message_update(2), None)
+    assert handled == [1, 1, 1, 2]
+    assert rejected == ["rate", "rate"]
+    # Об отказе пользователь узнает один раз за notice_interval
+    first.effective_message.reply_text.assert_called_once_with(RATE_LIMITED_TEXT)
+
+
+def test_rejected_callback_query_is_answered():
+    limiter = IngressLimiter(rate=1, burst=1)
+    handler = limiter.guard(lambda update, context: None)
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=1), callback_query=MagicMock(),
+                             effective_message=MagicMock())
+    handler(update, None)
+    handler(update, None)
+    handler(update, None)
+    assert [call.args for call in update.callback_query.answer.call_args_list] == [(RATE_LIMITED_TEXT,), ()]
+    update.effective_message.reply_text.assert_not_called()
+
+
+def test_concurrency_limit():
+    rejected = []
+    limiter = IngressLimiter(rate=0, concurrency=1, on_reject=rejected.append)
+    entered = threading.Event()
+    release = threading.Event()
+
+    def slow(update, context):
+        entered.set()
+        release.wait(5)
+
+    handler = limiter.guard(slow)
+    thread = threading.Thread(target=handler, args=(message_update(1), None))
+    thread.start()
+    assert entered.wait(5)
+    busy = message_update(2)
+    handler(busy, None)
+    release.set()
+    thread.join(5)
+    assert rejected == ["busy"]
+    busy.effective_message.reply_text.assert_called_once_with(BUSY_TEXT)
+    assert limiter.stats()["active"] == 0
+
+
+def test_active_counter_released_on_error():
+    limiter = IngressLimiter(concurrency=1)
+
+    def broken(update, context):
+        raise RuntimeError("handler")
+
+    handler = limiter.guard(broken)
+    for _ in range(2):
+        try:
+            handler(message_update(1), None)
+        except RuntimeError:
+            pass
+    assert limiter.stats()["active"] == 0
+    assert handler.__wrapped__ is broken
+
+
+def test_fractional_burst_still_admits():
+    limiter = IngressLimiter(rate=0.5, burst=0.5)
+    handled = []
+    handler = limiter.guard(lambda update, context: handled.append(update.effective_user.id))
+    handler(message_update(1), None)
+    handler(message_update(1), None)
+    assert handled == [1]
@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+from telegram.error import BadRequest, ChatMigrated, NetworkError, RetryAfter, TelegramError, Unauthorized
+
+from outbound import OutboundQueue
+
+
+class FakeBot:
+    """send_message по очереди бросает исключения из errors, затем отправляет успешно."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.sent = []
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self._lock:
+            self.calls += 1
+            if self.errors:
+                raise self.errors.pop(0)
+            self.sent.append((chat_id, text))
+
+
+def run(bot, *messages, **options):
+    """Отправляет сообщения через очередь с одним воркером и дожидается, пока она опустеет."""
+    options.setdefault("max_backoff", 0)
+    queue = OutboundQueue(bot, workers=1, global_rate=1000, chat_rate=1000, **options)
+    queue.start()
+    for chat_id, text, callbacks in messages:
+        queue.send(chat_id, text, **callbacks)
+    queue.stop(timeout=10)
+    return queue.stats()
+
+
+def test_sends_and_reports():
+    bot = FakeBot()
+    sent = []
+    stats = run(bot, (1, "a", {"on_sent": lambda: sent.append("a")}), (2, "b", {}))
+    assert bot.sent == [(1, "a"), (2, "b")]
+    assert sent == ["a"]
+    assert stats["sent"] == 2 and stats["failed"] == 0 and stats["in_flight"] == 0
+
+
+@pytest.mark.parametrize("error", [BadRequest("Chat not found"), Unauthorized("Forbidden: bot was blocked")])
+def test_permanent_errors_fail_without_retry(error):
+    bot = FakeBot(error)
+    failed = []
+    stats = run(bot, (1, "a", {"on_failed": failed.append}))
+    assert bot.calls == 1
+    assert failed == [error]
+    assert stats["failed"] == 1 and stats["retried"] == 0
+
+
+@pytest.mark.parametrize("error", [NetworkError("Connection reset"), TelegramError("Invalid server response")])
+def test_transient_errors_are_retried(error):
+    bot = FakeBot(error, error)
+    stats = run(bot, (1, "a", {}))
+    assert bot.sent == [(1, "a")]
+    assert stats["retried"] == 2 and stats["failed"] == 0
+
+
+def test_retries_are_bounded():
+    error = NetworkError("Connection reset")
+    bot = FakeBot(*[error] * 5)
+    failed = []
+    stats = run(bot, (1, "a", {"on_failed": failed.append}), max_attempts=3)
+    assert bot.calls == 3
+    assert failed == [error]
+    assert stats["retried"] == 2 and stats["failed"] == 1
+
+
+def test_retry_after_and_chat_migration():
+    bot = FakeBot(RetryAfter(0), ChatMigrated(-100))
+    stats = run(bot, (1, "a", {}))
+    assert bot.sent == [(-100, "a")]
+    assert stats["throttled"] == 1 and stats["retried"] == 2
+
+
+def test_unexpected_error_fails_message_and_keeps_worker():
+    error = ValueError("boom")
+    bot = FakeBot(error)
+    failed = []
+    stats = run(bot, (1, "a", {"on_failed": failed.append}), (2, "b", {}))
+    assert failed == [error]
+    assert bot.sent == [(2, "b")]
+    assert stats["failed"] == 1 and stats["sent"] == 1
+
+
+def test_raising_callbacks_do_not_stop_worker():
+    def broken(*args):
+        raise RuntimeError("callback")
+
+    bot = FakeBot(BadRequest("Chat not found"))
+    stats = run(bot, (1, "a", {"on_failed": broken}), (2, "b", {"on_sent": broken}), (3, "c", {}))
+    assert bot.sent == [(2, "b"), (3, "c")]
+    assert stats["failed"] == 1 and stats["sent"] == 2 and stats["in_flight"] == 0
@@ -0,0 +1,29 @@
+import pytest
+
+from ratelimit import TokenBucket
+
+
+def test_consume_within_capacity():
+    bucket = TokenBucket(2, capacity=3)
+    now = bucket.updated
+    assert [bucket.consume(now) for _ in range(3)] == [0, 0, 0]
+    assert bucket.consume(now) == pytest.approx(0.5)
+    assert bucket.consume(now + 0.5) == 0
+
+
+def test_fractional_rate_refills_whole_token():
+    # 20 сообщений в минуту — лимит Telegram для групп
+    bucket = TokenBucket(1 / 3)
+    now = bucket.updated
+    assert bucket.capacity == 1
+    assert bucket.consume(now) == 0
+    assert bucket.consume(now) == pytest.approx(3)
+    assert bucket.consume(now + 3) == 0
+
+
+def test_pause_delays_next_token():
+    bucket = TokenBucket(10)
+    now = bucket.updated
+    bucket.pause(5, now)
+    assert bucket.delay(now) == pytest.approx(5.1)
+    assert bucket.consume(now + 5.1) == 0
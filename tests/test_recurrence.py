@@ -0,0 +1,50 @@
+from datetime import datetime
+
+import pytest
+
+from recurrence import CronRule, preset_rule
+
+
+@pytest.mark.parametrize("expression, moment, expected", [
+    ("30 9 * * *", datetime(2030, 1, 1, 9, 29), datetime(2030, 1, 1, 9, 30)),
+    # Строго после moment: само время срабатывания не возвращается
+    ("30 9 * * *", datetime(2030, 1, 1, 9, 30), datetime(2030, 1, 2, 9, 30)),
+    ("*/15 * * * *", datetime(2030, 1, 1, 23, 50, 30), datetime(2030, 1, 2, 0, 0)),
+    # 4 января 2030 — пятница, следующий будний день — понедельник 7-е
+    ("0 9 * * 1-5", datetime(2030, 1, 4, 10, 0), datetime(2030, 1, 7, 9, 0)),
+    # Воскресенье задается и 0, и 7
+    ("0 9 * * 7", datetime(2030, 1, 1), datetime(2030, 1, 6, 9, 0)),
+    ("0 0 31 * *", datetime(2030, 2, 1), datetime(2030, 3, 31, 0, 0)),
+    ("0 0 29 2 *", datetime(2030, 3, 1), datetime(2032, 2, 29, 0, 0)),
+    ("0 12 1 1 *", datetime(2030, 12, 31, 12, 0), datetime(2031, 1, 1, 12, 0)),
+])
+def test_next_after(expression, moment, expected):
+    assert CronRule(expression).next_after(moment) == expected
+
+
+def test_day_and_weekday_match_either():
+    # Как в cron: 13-е число или любая пятница; 1 марта 2030 — пятница
+    rule = CronRule("0 0 13 * 5")
+    assert rule.next_after(datetime(2030, 2, 28)) == datetime(2030, 3, 1, 0, 0)
+    assert rule.next_after(datetime(2030, 3, 9)) == datetime(2030, 3, 13, 0, 0)
+
+
+def test_next_after_returns_none_for_impossible_date():
+    assert CronRule("0 0 30 2 *").next_after(datetime(2030, 1, 1)) is None
+
+
+def test_first_at_or_after_includes_moment():
+    assert CronRule("30 9 * * *").first_at_or_after(datetime(2030, 1, 1, 9, 30)) == datetime(2030, 1, 1, 9, 30)
+
+
+def test_preset_rule():
+    first = datetime(2030, 1, 6, 8, 5)
+    assert preset_rule("daily", first) == "5 8 * * *"
+    assert preset_rule("weekly", first) == "5 8 * * 0"
+    assert preset_rule("monthly", first) == "5 8 6 * *"
+
+
+@pytest.mark.parametrize("expression", ["* * * *", "61 * * * *", "* * 0 * *", "*/0 * * * *", "5-1 * * * *"])
+def test_invalid_expression(expression):
+    with pytest.raises(ValueError):
+        CronRule(expression)
@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import select
+
+from database import Note, Reminder
+from reminders import ReminderScheduler
+from timezones import utcnow
+
+
+@pytest.fixture
+def scheduler(session_factory):
+    return ReminderScheduler(session_factory)
+
+
+def add_reminders(session_factory, scheduler, count, remind_at, rule=None):
+    with session_factory() as session:
+        note = Note(user_id=1, title="t", content="c")
+        session.add(note)
+        session.flush()
+        reminders = scheduler.add_many(session, 1, [note.note_id] * count, remind_at, rule=rule)
+        session.commit()
+        return [reminder.reminder_id for reminder in reminders]
+
+
+def stored(session_factory):
+    with session_factory() as session:
+        return dict(session.execute(select(Reminder.reminder_id, Reminder.remind_at)).all())
+
+
+def test_poll_and_pop_due(session_factory, scheduler):
+    now = utcnow()
+    due = add_reminders(session_factory, scheduler, 2, now - timedelta(minutes=1))
+    later = add_reminders(session_factory, scheduler, 1, now + timedelta(minutes=5))
+    scheduler.poll()
+    assert scheduler.pending() == 3
+    assert [reminder_id for _, reminder_id in scheduler.pop_due(now)] == due
+    assert scheduler.pending() == 1
+    # Повторный опрос не ставит в кучу то, что уже выдано, но еще не подтверждено
+    scheduler.poll()
+    assert [reminder_id for _, reminder_id in scheduler.pop_due(now + timedelta(minutes=10))] == later
+
+
+def test_ack_deletes_on_flush(session_factory, scheduler):
+    reminder_ids = add_reminders(session_factory, scheduler, 3, utcnow() - timedelta(minutes=1))
+    scheduler.poll()
+    scheduler.pop_due()
+    scheduler.ack(reminder_ids[0])
+    scheduler.ack(reminder_ids[2])
+    assert set(stored(session_factory)) == set(reminder_ids)
+    scheduler.flush()
+    assert set(stored(session_factory)) == {reminder_ids[1]}
+
+
+def test_advance_reschedules_and_rearms(session_factory, scheduler):
+    now = utcnow()
+    [reminder_id] = add_reminders(session_factory, scheduler, 1, now - timedelta(minutes=1), rule="* * * * *")
+    scheduler.poll()
+    scheduler.pop_due(now)
+    next_at = now + timedelta(minutes=2)
+    scheduler.advance(reminder_id, next_at)
+    scheduler.flush()
+    assert stored(session_factory) == {reminder_id: next_at}
+    # Новое время попадает в уже загруженное окно, поэтому напоминание сразу возвращается в кучу
+    assert scheduler.pop_due(next_at) == [(next_at, reminder_id)]
+
+
+def test_reschedule_skips_deleted_rows(session_factory, scheduler):
+    now = utcnow()
+    first, second = add_reminders(session_factory, scheduler, 2, now - timedelta(minutes=1), rule="* * * * *")
+    scheduler.poll()
+    scheduler.pop_due(now)
+    scheduler.complete([first])
+    next_at = now + timedelta(minutes=2)
+    scheduler.advance(first, next_at)
+    scheduler.advance(second, next_at)
+    scheduler.flush()
+    assert stored(session_factory) == {second: next_at}
+
+
+def test_flush_puts_batches_back_on_failure(session_factory, scheduler, monkeypatch):
+    now = utcnow()
+    acked, advanced = add_reminders(session_factory, scheduler, 2, now - timedelta(minutes=1))
+    scheduler.poll()
+    scheduler.pop_due(now)
+    scheduler.ack(acked)
+    scheduler.advance(advanced, now + timedelta(minutes=1))
+
+    def broken(reminder_ids):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(scheduler, "complete", broken)
+    with pytest.raises(RuntimeError):
+        scheduler.flush()
+    assert set(stored(session_factory)) == {acked, advanced}
+
+    monkeypatch.undo()
+    scheduler.flush()
+    assert stored(session_factory) == {advanced: now + timedelta(minutes=1)}
+
+
+def test_reschedule_failure_keeps_completed_acks(session_factory, scheduler, monkeypatch):
+    now = utcnow()
+    acked, advanced = add_reminders(session_factory, scheduler, 2, now - timedelta(minutes=1))
+    scheduler.ack(acked)
+    scheduler.advance(advanced, now + timedelta(minutes=1))
+
+    def broken(batch):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(scheduler, "reschedule", broken)
+    with pytest.raises(RuntimeError):
+        scheduler.flush()
+    monkeypatch.undo()
+    assert set(stored(session_factory)) == {advanced}
+    scheduler.flush()
+    assert stored(session_factory) == {advanced: now + timedelta(minutes=1)}
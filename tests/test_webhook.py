@@ -0,0 +1,23 @@
+import pytest
+
+from webhook import shard_of, update_user_id
+
+
+@pytest.mark.parametrize("data, expected", [
+    ({"message": {"chat": {"id": -100500}, "from": {"id": 7}}}, 7),
+    ({"edited_message": {"chat": {"id": 7}, "from": {"id": 7}}}, 7),
+    ({"callback_query": {"from": {"id": 8}, "message": {"chat": {"id": -100500}}}}, 8),
+    ({"chat_member": {"chat": {"id": -100500}, "from": {"id": 9}}}, 9),
+    ({"poll_answer": {"user": {"id": 10}}}, 10),
+    # У постов в канале нет отправителя-пользователя
+    ({"channel_post": {"chat": {"id": -100600}}}, -100600),
+    ({"update_id": 1}, 0),
+])
+def test_update_user_id(data, expected):
+    assert update_user_id(data) == expected
+
+
+def test_group_messages_follow_user_shard():
+    # Сообщения пользователя в группе попадают в тот же воркер, что и его напоминания
+    data = {"message": {"chat": {"id": -100500}, "from": {"id": 7}}}
+    assert shard_of(update_user_id(data), 4) == abs(7) % 4
@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select
+
+from database import Note
+from writebehind import NoteWriter
+
+CREATED_AT = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def writer(session_factory):
+    flushes = []
+    writer = NoteWriter(session_factory, max_delay=0.05, on_flush=lambda *args: flushes.append(args))
+    writer.flushes = flushes
+    yield writer
+    writer.stop(timeout=5)
+
+
+def titles(session_factory):
+    with session_factory() as session:
+        return dict(session.execute(select(Note.note_id, Note.title)).all())
+
+
+def test_writes_are_committed_in_one_batch(session_factory, writer):
+    done = []
+    for index in range(3):
+        writer.create(1, f"note {index}", "content", CREATED_AT, on_done=done.append)
+    writer.stop(timeout=5)
+    assert titles(session_factory) == {note_id: f"note {index}" for index, note_id in enumerate(done)}
+    assert sorted(done) == done
+    [(rows, seconds, waits, retried)] = writer.flushes
+    assert rows == 3 and len(waits) == 3 and not retried
+
+
+def test_update_reports_whether_note_exists(session_factory, writer):
+    created = []
+    writer.create(1, "old", "content", CREATED_AT, on_done=created.append)
+    writer.stop(timeout=5)
+    published = []
+    updates = NoteWriter(session_factory, max_delay=0, publish=lambda session, *key: published.append(key))
+    results = []
+    updates.update(1, created[0], {"title": "new"}, on_done=results.append)
+    updates.update(2, created[0], {"title": "someone else's"}, on_done=results.append)
+    updates.update(1, created[0] + 1, {"title": "missing"}, on_done=results.append)
+    updates.stop(timeout=5)
+    assert results == [True, False, False]
+    assert published == [(1, created[0])]
+    assert titles(session_factory) == {created[0]: "new"}
+
+
+def test_bad_write_does_not_fail_batch(session_factory, writer):
+    done, failed = [], []
+    writer.create(1, "first", "content", CREATED_AT, on_done=done.append, on_failed=failed.append)
+    writer.create(1, None, "content", CREATED_AT, on_done=done.append, on_failed=failed.append)
+    writer.create(1, "third", "content", CREATED_AT, on_done=done.append, on_failed=failed.append)
+    writer.stop(timeout=5)
+    assert len(done) == 2 and len(failed) == 1
+    assert sorted(titles(session_factory).values()) == ["first", "third"]
+    [(rows, seconds, waits, retried)] = writer.flushes
+    assert rows == 3 and retried
+
+
+def test_raising_callback_does_not_stop_writer(session_factory, writer):
+    def broken(result):
+        raise RuntimeError("callback")
+
+    done = []
+    writer.create(1, "first", "content", CREATED_AT, on_done=broken)
+    writer.create(1, "second", "content", CREATED_AT, on_done=done.append)
+    writer.stop(timeout=5)
+    assert len(done) == 1
+    assert len(titles(session_factory)) == 2